@@ -1,6 +1,7 @@
 import duckdb
 import logging
-import matplotlib.pyplot as plt
+
+import plots
 
 # Setting up logging
 logging.basicConfig(
@@ -62,37 +63,9 @@ def analysis():
         logger.info("Starting analysis: Monthly CO2 totals for plotting.")
         print("\n--- Generating Time-Series Plot of Monthly CO2 Totals ---")
 
-        # Use one efficient GROUP BY query per taxi type
-        yellow_monthly_data = con.execute("""
-            SELECT month_of_year, SUM(trip_co2_kgs)
-            FROM yellow_taxi_data_clean
-            GROUP BY month_of_year ORDER BY month_of_year;
-        """).fetchall()
-
-        green_monthly_data = con.execute("""
-            SELECT month_of_year, SUM(trip_co2_kgs)
-            FROM green_taxi_data_clean
-            GROUP BY month_of_year ORDER BY month_of_year;
-        """).fetchall()
-
-        # Prepare for plotting
-        yellow_totals = {row[0]: row[1] for row in yellow_monthly_data}
-        green_totals = {row[0]: row[1] for row in green_monthly_data}
-        months = range(1, 13)
-        y_vals = [yellow_totals.get(m, 0) for m in months]
-        g_vals = [green_totals.get(m, 0) for m in months]
-
-        plt.figure(figsize=(12, 7))
-        plt.plot(months, y_vals, marker='o', linestyle='-', label='Yellow Taxi CO2', color='gold')
-        plt.plot(months, g_vals, marker='s', linestyle='--', label='Green Taxi CO2', color='green')
-
-        plt.title('Total Monthly CO2 Emissions by Taxi Type', fontsize=16)
-        plt.xlabel('Month of the Year', fontsize=12)
-        plt.ylabel('Total CO2 (kgs)', fontsize=12)
-        plt.xticks(months)
-        plt.legend()
-        plt.grid(True, which='both', linestyle='--', linewidth=0.5)
-        plt.savefig('monthly_co2_totals.png')
+        # One aggregate query feeds the chart; the frame is columnar NumPy arrays
+        frame = plots.fetch_aggregate(con, table_template="{taxi_type}_taxi_data_clean")
+        plots.render_chart(frame, {'kind': 'seasonal', 'filename': 'monthly_co2_totals.png'})
 
         logger.info("Plot saved as 'monthly_co2_totals.png'.")
 
@@ -1,7 +1,7 @@
 import duckdb
 import logging
-import matplotlib.pyplot as plt
-import pandas as pd
+
+import governor
 
 # --- Configuration ---
 logging.basicConfig(
@@ -12,16 +12,22 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 DB_FILE = "emissions10yrs.duckdb"
 
-def analyze_data():
+def analyze_data(plot=True, db_file=DB_FILE):
     """
     Connects to the database and performs the final analysis as required.
+
+    Args:
+        plot (bool): Also save the seasonal chart. With False, plotting
+            libraries are never imported and only the text report is produced.
+        db_file (str): The database to analyze.
     """
     con = None
     try:
         # Connect to the correct database file in read-only mode
-        con = duckdb.connect(DB_FILE, read_only=True)
-        logger.info(f"Successfully connected to {DB_FILE} for analysis.")
-        print(f"Connected to {DB_FILE} for analysis.")
+        con = duckdb.connect(db_file, read_only=True)
+        governor.configure_connection(con, 'analysis')
+        logger.info(f"Successfully connected to {db_file} for analysis.")
+        print(f"Connected to {db_file} for analysis.")
         
         # 1. Largest carbon producing trip
         logger.info("Starting analysis: Largest carbon producing trips.")
@@ -35,6 +41,7 @@ def analyze_data():
                     passenger_count, 
                     trip_co2_kgs
                 FROM {table_name}
+                WHERE trip_anomaly IS NULL
                 ORDER BY trip_co2_kgs DESC
                 LIMIT 1;
             """).fetchone()
@@ -72,43 +79,23 @@ def analyze_data():
                     print(sum_low); logger.info(sum_low)
             logger.info(f"Analysis complete: Averages and Totals by {label}.")
 
-        # 6. Time-series plot of MONTH vs CO2 totals (Your Original Logic)
-        logger.info("Starting analysis: Monthly CO2 totals for plotting.")
-        print("\n--- Generating Seasonal Plot of Monthly CO2 Totals ---")
-
-        # Query aggregates all years into 12 monthly totals
-        yellow_monthly_data = con.execute("""
-            SELECT month_of_year, SUM(trip_co2_kgs)
-            FROM yellow_taxi_final
-            GROUP BY month_of_year ORDER BY month_of_year;
-        """).fetchall()
+        if not plot:
+            return
 
-        green_monthly_data = con.execute("""
-            SELECT month_of_year, SUM(trip_co2_kgs)
-            FROM green_taxi_final
-            GROUP BY month_of_year ORDER BY month_of_year;
-        """).fetchall()
+        # 6. Time-series plot of MONTH vs CO2 totals
+        import plots
 
-        # Process results into a plottable format using your dictionary method
-        yellow_totals = {row[0]: row[1] for row in yellow_monthly_data}
-        green_totals = {row[0]: row[1] for row in green_monthly_data}
-        months = range(1, 13)
-        y_vals = [yellow_totals.get(m, 0) for m in months]
-        g_vals = [green_totals.get(m, 0) for m in months]
-
-        plt.figure(figsize=(12, 7))
-        plt.plot(months, y_vals, marker='o', linestyle='-', label='Yellow Taxi CO2', color='gold')
-        plt.plot(months, g_vals, marker='s', linestyle='--', label='Green Taxi CO2', color='green')
+        logger.info("Starting analysis: Monthly CO2 totals for plotting.")
+        print("\n--- Generating Seasonal Plot of Monthly CO2 Totals ---")
 
-        plt.title('Total Monthly CO2 Emissions by Taxi Type (Aggregated 2015-2024)', fontsize=16)
-        plt.xlabel('Month of the Year', fontsize=12)
-        plt.ylabel('Total CO2 (kgs)', fontsize=12)
-        plt.xticks(months)
-        plt.legend()
-        plt.grid(True, which='both', linestyle='--', linewidth=0.5)
-        
+        # One aggregate query feeds the chart; the frame is columnar NumPy arrays
+        frame = plots.fetch_aggregate(con)
         plot_filename = 'monthly_co2_totals_seasonal_10yrs.png'
-        plt.savefig(plot_filename)
+        plots.render_chart(frame, {
+            'kind': 'seasonal',
+            'filename': plot_filename,
+            'title': 'Total Monthly CO2 Emissions by Taxi Type (Aggregated 2015-2024)',
+        })
         print(f"Plot saved successfully as '{plot_filename}'.")
         logger.info(f"Plot saved as '{plot_filename}'.")
 
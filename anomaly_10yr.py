@@ -0,0 +1,167 @@
+import duckdb
+import logging
+import math
+
+from load_10yr import FINGERPRINT_COLUMN
+
+# --- Configuration ---
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    filename='transform.log',
+)
+logger = logging.getLogger(__name__)
+DB_FILE = "emissions10yrs.duckdb"
+
+BASELINE_TABLE = "trip_speed_baselines"
+MAX_PLAUSIBLE_MPH = 100        # Faster than this is physically implausible for a city taxi
+ROBUST_Z_THRESHOLD = 6.0       # Flag when more than this many robust SDs from the baseline median
+MAD_TO_SD = 1.4826             # Scales a MAD to a standard deviation for normal data
+MIN_BASELINE_TRIPS = 30        # Zone/hour groups with fewer trips fall back to the hour-only baseline
+BASELINE_SAMPLE_ROWS = 20_000_000  # Above this, baselines come from a fingerprint-keyed sample of the clean table
+
+
+def speed_expr(pickup_col, dropoff_col, alias='t'):
+    """Average speed in mph; NULL for zero-duration trips. Same formula as avg_mph in the transform."""
+    return f"{alias}.trip_distance / NULLIF((EPOCH({alias}.{dropoff_col}) - EPOCH({alias}.{pickup_col})) / 3600.0, 0)"
+
+
+def build_speed_baselines(con, taxi_type, source_table=None):
+    """
+    Computes robust speed and distance baselines (median and MAD) for one taxi
+    type from its clean table. A single grouped pass with GROUPING SETS yields
+    both the per pickup zone/hour-of-day rows and the per hour-of-day fallback
+    rows (is_zone = false). Large tables are sampled down to about
+    BASELINE_SAMPLE_ROWS, so the holistic median/MAD aggregates stay small.
+
+    The sample keeps the trips whose fingerprint is a multiple of N, so it is
+    deterministic: the same trips always give the same baselines, whatever
+    the storage order, thread count or split into shards.
+
+    source_table can name any relation holding the clean trips, e.g. the union
+    of the shards' final tables (see shard_10yr.merge_shards).
+    """
+    cleaned_table = source_table or f"{taxi_type}_taxi_trips_clean"
+    prefix = 'tpep' if taxi_type == 'yellow' else 'lpep'
+    pickup_col, dropoff_col = f"{prefix}_pickup_datetime", f"{prefix}_dropoff_datetime"
+
+    try:
+        rows = con.execute(f"SELECT COUNT(*) FROM {cleaned_table}").fetchone()[0]
+        sample = ""
+        if rows > BASELINE_SAMPLE_ROWS:
+            every = math.ceil(rows / BASELINE_SAMPLE_ROWS)
+            sample = f"WHERE t.{FINGERPRINT_COLUMN} % {every} = 0"
+        logger.info(f"Computing speed baselines for '{cleaned_table}' ({rows:,} rows{', ' + sample if sample else ''}).")
+
+        con.execute(f"""
+            CREATE TABLE IF NOT EXISTS {BASELINE_TABLE} (
+                taxi_type VARCHAR,
+                is_zone BOOLEAN,
+                PULocationID INTEGER,
+                hour_of_day INTEGER,
+                trips BIGINT,
+                median_mph DOUBLE,
+                mad_mph DOUBLE,
+                median_distance DOUBLE,
+                mad_distance DOUBLE
+            )
+        """)
+        con.execute(f"DELETE FROM {BASELINE_TABLE} WHERE taxi_type = ?", [taxi_type])
+        con.execute(f"""
+            INSERT INTO {BASELINE_TABLE}
+            SELECT
+                '{taxi_type}' AS taxi_type,
+                GROUPING(PULocationID) = 0 AS is_zone,
+                PULocationID,
+                hour_of_day,
+                COUNT(*) AS trips,
+                median(mph) AS median_mph,
+                mad(mph) AS mad_mph,
+                median(trip_distance) AS median_distance,
+                mad(trip_distance) AS mad_distance
+            FROM (
+                SELECT
+                    t.PULocationID,
+                    hour(t.{pickup_col}) AS hour_of_day,
+                    t.trip_distance,
+                    {speed_expr(pickup_col, dropoff_col)} AS mph
+                FROM {cleaned_table} t
+                {sample}
+            )
+            GROUP BY GROUPING SETS ((PULocationID, hour_of_day), (hour_of_day))
+        """)
+        count = con.execute(f"SELECT COUNT(*) FROM {BASELINE_TABLE} WHERE taxi_type = ?", [taxi_type]).fetchone()[0]
+        logger.info(f"Stored {count:,} {taxi_type} speed baselines in '{BASELINE_TABLE}'.")
+        print(f"Stored {count:,} {taxi_type} speed baselines in '{BASELINE_TABLE}'.")
+
+    except Exception as e:
+        logger.error(f"An error occurred while computing speed baselines for {taxi_type} data: {e}")
+        print(f"An error occurred while computing speed baselines for {taxi_type} data: {e}")
+
+
+def baseline_joins(taxi_type, pickup_col, alias='t'):
+    """LEFT JOINs of the zone/hour baseline (z) and the hour-only fallback (h) for use in a FROM clause."""
+    return f"""
+            LEFT JOIN {BASELINE_TABLE} z
+                ON z.taxi_type = '{taxi_type}' AND z.is_zone AND z.trips >= {MIN_BASELINE_TRIPS}
+                AND z.PULocationID = {alias}.PULocationID AND z.hour_of_day = hour({alias}.{pickup_col})
+            LEFT JOIN {BASELINE_TABLE} h
+                ON h.taxi_type = '{taxi_type}' AND NOT h.is_zone
+                AND h.hour_of_day = hour({alias}.{pickup_col})"""
+
+
+def anomaly_expr(pickup_col, dropoff_col, alias='t'):
+    """
+    CASE expression for the trip_anomaly column: NULL for plausible trips,
+    otherwise the first check the trip fails. A MAD of 0 disables that
+    robust check rather than flagging every deviation.
+    """
+    mph = speed_expr(pickup_col, dropoff_col, alias)
+    limit = f"{ROBUST_Z_THRESHOLD} * {MAD_TO_SD}"
+    return f"""CASE
+                    WHEN {mph} > {MAX_PLAUSIBLE_MPH} THEN 'impossible_speed'
+                    WHEN ABS({mph} - COALESCE(z.median_mph, h.median_mph))
+                         > {limit} * NULLIF(COALESCE(z.mad_mph, h.mad_mph), 0) THEN 'speed_outlier'
+                    WHEN {alias}.trip_distance - COALESCE(z.median_distance, h.median_distance)
+                         > {limit} * NULLIF(COALESCE(z.mad_distance, h.mad_distance), 0) THEN 'distance_outlier'
+                END"""
+
+
+def reflag_query(taxi_type, final_relation):
+    """
+    Returns a SELECT of final_relation with trip_anomaly recomputed against the
+    current baselines; every other column passes through unchanged.
+    """
+    prefix = 'tpep' if taxi_type == 'yellow' else 'lpep'
+    pickup_col, dropoff_col = f"{prefix}_pickup_datetime", f"{prefix}_dropoff_datetime"
+    return f"""
+            SELECT t.* REPLACE ({anomaly_expr(pickup_col, dropoff_col)} AS trip_anomaly)
+            FROM {final_relation} t{baseline_joins(taxi_type, pickup_col)}"""
+
+
+def report_anomalies(con, taxi_type):
+    """Prints how many trips in the final table carry each anomaly flag."""
+    final_table = f"{taxi_type}_taxi_final"
+    print(f"\n--- Trip Anomalies ({taxi_type.capitalize()}) ---")
+    for flag, trips, co2 in con.execute(f"""
+        SELECT trip_anomaly, COUNT(*), SUM(trip_co2_kgs)
+        FROM {final_table}
+        WHERE trip_anomaly IS NOT NULL
+        GROUP BY trip_anomaly
+        ORDER BY trip_anomaly
+    """).fetchall():
+        print(f"{flag}: {trips:,} trips, {co2:,.0f} kgs CO2")
+
+
+if __name__ == "__main__":
+    con = None
+    try:
+        con = duckdb.connect(DB_FILE, read_only=True)
+        for taxi_type in ['yellow', 'green']:
+            report_anomalies(con, taxi_type)
+    except Exception as e:
+        print(f"A fatal error occurred in the main process: {e}")
+        logger.error(f"A fatal error occurred in the main process: {e}")
+    finally:
+        if con:
+            con.close()
@@ -0,0 +1,416 @@
+import argparse
+import duckdb
+import importlib
+import logging
+import multiprocessing
+import statistics
+import os
+import resource
+import shutil
+import subprocess
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+# --- Configuration ---
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    filename='benchmark.log',
+)
+logger = logging.getLogger(__name__)
+HISTORY_DB = "perf_history.duckdb"
+WORK_DIR = "benchmark_data"
+RUNS_TABLE = "pipeline_runs"
+BASELINE_TABLE = "perf_baselines"
+
+# The fixed synthetic dataset: same rows on every machine and every run.
+# Bump DATASET_VERSION whenever the generator or a stage's measured work changes, so old baselines no longer apply.
+# v2: the load stage no longer includes the rate-limit pause or the missing months.
+DATASET_VERSION = 2
+BENCHMARK_YEAR = 2024
+BENCHMARK_MONTHS = [1, 2]  # Must include January: load_10yr reads the schema from the 2024-01 file
+ROWS_PER_FILE = 250_000
+
+STAGES = ['load', 'clean', 'transform', 'analysis']
+# Table whose rows count as the stage's "rows processed" ({t} = taxi type)
+STAGE_ROWS_TABLE = {
+    'load': '{t}_taxi_trips',
+    'clean': '{t}_taxi_trips',
+    'transform': '{t}_taxi_trips_clean',
+    'analysis': '{t}_taxi_final',
+}
+
+# Allowed slowdown / extra memory over the baseline before a stage fails (0.25 = 25%)
+TIME_TOLERANCE = 0.25
+MEMORY_TOLERANCE = 0.25
+# Sub-second stages jitter by more than any sane tolerance; slowdowns below this never fail
+MIN_SLOWDOWN_SECONDS = 1.0
+# Baselines are the median of this many recent runs
+BASELINE_RUNS = 3
+
+
+def dataset_name(rows_per_file=ROWS_PER_FILE):
+    """Identifies the synthetic dataset; runs and baselines only compare within one."""
+    return f"synthetic-v{DATASET_VERSION}-{len(BENCHMARK_MONTHS)}x{rows_per_file}"
+
+
+def generate_dataset(dataset_dir, rows_per_file=ROWS_PER_FILE):
+    """
+    Writes the synthetic monthly trip files (TLC names and columns) into
+    dataset_dir. Every value derives from hash() of the row number, so the
+    files are identical on every run. About 4% of rows are duplicates and a
+    few percent break each cleaning rule, so the clean stage does real work.
+    """
+    os.makedirs(dataset_dir, exist_ok=True)
+    con = duckdb.connect()
+    try:
+        for taxi_type in ['yellow', 'green']:
+            prefix = 'tpep' if taxi_type == 'yellow' else 'lpep'
+            for month in BENCHMARK_MONTHS:
+                path = os.path.join(dataset_dir, f"{taxi_type}_tripdata_{BENCHMARK_YEAR}-{month:02d}.parquet")
+                if os.path.exists(path):
+                    continue
+                start = f"{BENCHMARK_YEAR}-{month:02d}-01"
+                seed = month * 10 + (taxi_type == 'green')
+                trips = f"""
+                    SELECT
+                        (1 + i % 2)::INTEGER AS VendorID,
+                        TIMESTAMP '{start}' + to_seconds((hash(i, {seed}, 1) % 2419200)::BIGINT) AS {prefix}_pickup_datetime,
+                        TIMESTAMP '{start}' + to_seconds((hash(i, {seed}, 1) % 2419200)::BIGINT
+                            + 60 + (hash(i, {seed}, 2) % 3600)::BIGINT
+                            - CASE WHEN i % 97 = 0 THEN 7200 ELSE 0 END) AS {prefix}_dropoff_datetime,
+                        (i % 6)::BIGINT AS passenger_count,
+                        CASE WHEN i % 211 = 0 THEN 150.0
+                             ELSE round((hash(i, {seed}, 3) % 2000) / 100.0, 2) END AS trip_distance,
+                        (1 + hash(i, {seed}, 4) % 265)::INTEGER AS PULocationID,
+                        (1 + hash(i, {seed}, 5) % 265)::INTEGER AS DOLocationID,
+                        round((hash(i, {seed}, 6) % 8000) / 100.0, 2) AS fare_amount
+                    FROM range({rows_per_file}) r(i)
+                """
+                con.execute(f"""
+                    COPY (
+                        SELECT * FROM ({trips})
+                        UNION ALL
+                        SELECT * FROM ({trips}) WHERE hash(VendorID, {prefix}_pickup_datetime) % 25 = 0
+                    ) TO '{path}' (FORMAT parquet)
+                """)
+        logger.info(f"Synthetic dataset '{dataset_name(rows_per_file)}' ready in '{dataset_dir}'.")
+    finally:
+        con.close()
+
+
+def _run_load(db_file, dataset_dir):
+    import governor
+    from load_10yr import EMISSIONS_CSV_PATH, create_emissions_lookup, load_taxi_data
+
+    con = duckdb.connect(db_file)
+    try:
+        governor.configure_connection(con, 'load')
+        for taxi_type in ['yellow', 'green']:
+            # No rate-limit pause for local files, so the gate times load work rather than time.sleep
+            load_taxi_data(con, taxi_type, [BENCHMARK_YEAR], base_url=dataset_dir,
+                           months=BENCHMARK_MONTHS, pause_seconds=0)
+        create_emissions_lookup(con, EMISSIONS_CSV_PATH)
+    finally:
+        con.close()
+
+
+def _run_clean(db_file, dataset_dir):
+    from clean_10yr import clean_green_taxi_data, clean_yellow_taxi_data
+    clean_green_taxi_data(db_file)
+    clean_yellow_taxi_data(db_file)
+
+
+def _run_transform(db_file, dataset_dir):
+    import governor
+    from transform_10yr import transform_taxi_data
+    from zones_10yr import build_zone_pair_rollup
+
+    con = duckdb.connect(db_file)
+    try:
+        governor.configure_connection(con, 'transform')
+        for taxi_type in ['yellow', 'green']:
+            transform_taxi_data(con, taxi_type)
+            build_zone_pair_rollup(con, taxi_type)
+    finally:
+        con.close()
+
+
+def _run_analysis(db_file, dataset_dir):
+    from analysis_10yr import analyze_data
+    analyze_data(plot=False, db_file=db_file)
+
+
+STAGE_MODULES = {
+    'load': 'load_10yr',
+    'clean': 'clean_10yr',
+    'transform': 'transform_10yr',
+    'analysis': 'analysis_10yr',
+}
+STAGE_FUNCTIONS = {
+    'load': _run_load,
+    'clean': _run_clean,
+    'transform': _run_transform,
+    'analysis': _run_analysis,
+}
+
+
+def measure_stage(stage, db_file, dataset_dir):
+    """
+    Runs one stage and returns (seconds, rows, peak_memory_bytes). Meant to
+    run in a fresh process: the peak resident set size then belongs to this
+    stage alone.
+    """
+    # Pay the module imports (and their logging setup) before the clock starts
+    importlib.import_module(STAGE_MODULES[stage])
+
+    start = time.perf_counter()
+    STAGE_FUNCTIONS[stage](db_file, dataset_dir)
+    seconds = time.perf_counter() - start
+
+    con = duckdb.connect(db_file, read_only=True)
+    try:
+        rows = 0
+        for taxi_type in ['yellow', 'green']:
+            table_name = STAGE_ROWS_TABLE[stage].format(t=taxi_type)
+            try:
+                rows += con.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+            except duckdb.CatalogException:
+                logger.warning(f"Stage '{stage}' did not produce '{table_name}'.")
+    finally:
+        con.close()
+
+    # ru_maxrss is in KiB on Linux
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return seconds, rows, peak_memory
+
+
+def ensure_history(con):
+    """Creates the run-history and baseline tables."""
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {RUNS_TABLE} (
+            run_id VARCHAR,
+            dataset VARCHAR,
+            stage VARCHAR,
+            started_at TIMESTAMP,
+            git_commit VARCHAR,
+            seconds DOUBLE,
+            rows BIGINT,
+            rows_per_second DOUBLE,
+            peak_memory_bytes BIGINT
+        )
+    """)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {BASELINE_TABLE} (
+            dataset VARCHAR,
+            stage VARCHAR,
+            seconds DOUBLE,
+            rows BIGINT,
+            rows_per_second DOUBLE,
+            peak_memory_bytes BIGINT,
+            runs INTEGER,
+            updated_at TIMESTAMP,
+            PRIMARY KEY (dataset, stage)
+        )
+    """)
+
+
+def _git_commit():
+    """Short hash of the checked-out commit, or None outside a git checkout."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_pipeline(work_dir=WORK_DIR, rows_per_file=ROWS_PER_FILE, history_db=HISTORY_DB):
+    """
+    Runs load, clean, transform and analysis against the synthetic dataset in
+    a fresh database, each stage in its own process, and records every
+    stage's measurements in the run history.
+
+    Returns:
+        tuple: (run_id, {stage: (seconds, rows, peak_memory_bytes)}).
+    """
+    dataset_dir = os.path.join(work_dir, dataset_name(rows_per_file))
+    db_file = os.path.join(work_dir, "benchmark.duckdb")
+    generate_dataset(dataset_dir, rows_per_file)
+    for path in (db_file, db_file + ".wal"):
+        if os.path.exists(path):
+            os.remove(path)
+    shutil.rmtree(os.path.join(work_dir, "duckdb_tmp"), ignore_errors=True)
+
+    run_id = uuid.uuid4().hex[:12]
+    started_at = time.strftime('%Y-%m-%d %H:%M:%S')
+    print(f"--- Benchmark run {run_id} on '{dataset_name(rows_per_file)}' ---")
+    results = {}
+    # spawn: every stage starts from an empty process, so peak RSS is its own
+    context = multiprocessing.get_context('spawn')
+    for stage in STAGES:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results[stage] = pool.submit(measure_stage, stage, db_file, dataset_dir).result()
+        seconds, rows, peak_memory = results[stage]
+        logger.info(f"Run {run_id}: {stage} took {seconds:.2f}s for {rows:,} rows, peak {peak_memory / 2**20:,.0f} MiB.")
+        print(f"{stage}: {seconds:.2f}s, {rows:,} rows, peak {peak_memory / 2**20:,.0f} MiB")
+
+    con = duckdb.connect(history_db)
+    try:
+        ensure_history(con)
+        commit = _git_commit()
+        con.executemany(f"INSERT INTO {RUNS_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+            [run_id, dataset_name(rows_per_file), stage, started_at, commit,
+             seconds, rows, rows / seconds if seconds else None, peak_memory]
+            for stage, (seconds, rows, peak_memory) in results.items()
+        ])
+    finally:
+        con.close()
+    return run_id, results
+
+
+def update_baselines(history_db=HISTORY_DB, dataset=None, runs=BASELINE_RUNS):
+    """
+    Sets each stage's baseline to the median of its last `runs` recorded runs
+    on the dataset. The median keeps one noisy run from moving the baseline.
+    """
+    dataset = dataset or dataset_name()
+    con = duckdb.connect(history_db)
+    try:
+        ensure_history(con)
+        rows = con.execute(f"""
+            SELECT stage, list(seconds), list(rows), list(peak_memory_bytes)
+            FROM (
+                SELECT *, row_number() OVER (PARTITION BY stage ORDER BY started_at DESC) AS recent
+                FROM {RUNS_TABLE}
+                WHERE dataset = ?
+            )
+            WHERE recent <= ?
+            GROUP BY stage
+        """, [dataset, runs]).fetchall()
+        for stage, seconds, row_counts, peak_memory in rows:
+            median_seconds = statistics.median(seconds)
+            median_rows = int(statistics.median(row_counts))
+            con.execute(f"INSERT OR REPLACE INTO {BASELINE_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, current_timestamp)", [
+                dataset, stage, median_seconds, median_rows,
+                median_rows / median_seconds if median_seconds else None,
+                int(statistics.median(peak_memory)), len(seconds),
+            ])
+            print(f"Baseline {stage}: {median_seconds:.2f}s, {median_rows:,} rows, "
+                  f"peak {statistics.median(peak_memory) / 2**20:,.0f} MiB (median of {len(seconds)} runs)")
+        logger.info(f"Updated {len(rows)} baselines for '{dataset}'.")
+        if not rows:
+            print(f"No recorded runs on '{dataset}' yet.")
+    finally:
+        con.close()
+
+
+def compare_to_baselines(results, history_db=HISTORY_DB, dataset=None,
+                         time_tolerance=TIME_TOLERANCE, memory_tolerance=MEMORY_TOLERANCE):
+    """
+    Checks each stage of a run against its baseline. A stage fails when it is
+    slower than the baseline by more than time_tolerance (and by more than
+    MIN_SLOWDOWN_SECONDS), uses more peak memory than memory_tolerance
+    allows, or processed a different number of rows (the dataset is fixed,
+    so that means the pipeline's output changed). Stages without a baseline
+    are reported but never fail.
+
+    Returns:
+        list: One (stage, status, detail) tuple per stage; status is 'PASS', 'FAIL' or 'NEW'.
+    """
+    dataset = dataset or dataset_name()
+    con = duckdb.connect(history_db, read_only=True)
+    try:
+        baselines = {
+            row[0]: row[1:]
+            for row in con.execute(f"""
+                SELECT stage, seconds, rows, peak_memory_bytes FROM {BASELINE_TABLE} WHERE dataset = ?
+            """, [dataset]).fetchall()
+        }
+    finally:
+        con.close()
+
+    report = []
+    for stage, (seconds, rows, peak_memory) in results.items():
+        if stage not in baselines:
+            report.append((stage, 'NEW', f"{seconds:.2f}s, no baseline yet"))
+            continue
+        base_seconds, base_rows, base_memory = baselines[stage]
+        problems = []
+        # A zero baseline (e.g. a stage that wrote nothing) has no meaningful ratio
+        time_change = f"{seconds / base_seconds - 1:+.0%}" if base_seconds else "n/a"
+        memory_change = f"{peak_memory / base_memory - 1:+.0%}" if base_memory else "n/a"
+        if seconds > base_seconds * (1 + time_tolerance) and seconds - base_seconds > MIN_SLOWDOWN_SECONDS:
+            problems.append(f"{time_change} time (limit {time_tolerance:+.0%})")
+        if base_memory and peak_memory > base_memory * (1 + memory_tolerance):
+            problems.append(f"{memory_change} memory (limit {memory_tolerance:+.0%})")
+        if rows != base_rows:
+            problems.append(f"{rows:,} rows, baseline {base_rows:,}")
+        detail = (f"{seconds:.2f}s vs {base_seconds:.2f}s ({time_change}), "
+                  f"peak {peak_memory / 2**20:,.0f} vs {base_memory / 2**20:,.0f} MiB")
+        report.append((stage, 'FAIL' if problems else 'PASS', "; ".join(problems) if problems else detail))
+    return report
+
+
+def print_history(history_db=HISTORY_DB, dataset=None, limit=10):
+    """Prints the most recent runs, one line per run with every stage's time."""
+    dataset = dataset or dataset_name()
+    con = duckdb.connect(history_db, read_only=True)
+    try:
+        print(f"--- Last {limit} runs on '{dataset}' (seconds per stage) ---")
+        for run_id, started_at, commit, timings in con.execute(f"""
+            SELECT run_id, MIN(started_at), ANY_VALUE(git_commit),
+                   string_agg(stage || ' ' || round(seconds, 2), ', ' ORDER BY list_position(?, stage))
+            FROM {RUNS_TABLE}
+            WHERE dataset = ?
+            GROUP BY run_id
+            ORDER BY MIN(started_at) DESC
+            LIMIT ?
+        """, [STAGES, dataset, limit]).fetchall():
+            print(f"{started_at} {run_id} ({commit or 'no commit'}): {timings}")
+    finally:
+        con.close()
+
+
+def gate(time_tolerance=TIME_TOLERANCE, memory_tolerance=MEMORY_TOLERANCE,
+         work_dir=WORK_DIR, rows_per_file=ROWS_PER_FILE, history_db=HISTORY_DB):
+    """
+    Runs the benchmark, records it and prints the pass/fail report.
+    Returns True when no stage failed.
+    """
+    run_id, results = run_pipeline(work_dir, rows_per_file, history_db)
+    report = compare_to_baselines(results, history_db, dataset_name(rows_per_file), time_tolerance, memory_tolerance)
+    print(f"\n--- Performance gate (time {time_tolerance:+.0%}, memory {memory_tolerance:+.0%}) ---")
+    for stage, status, detail in report:
+        print(f"{stage:<10} [{status}] {detail}")
+    passed = all(status != 'FAIL' for _, status, _ in report)
+    logger.info(f"Run {run_id}: gate {'passed' if passed else 'failed'}.")
+    print(f"Run {run_id}: {'PASS' if passed else 'FAIL'}")
+    return passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the pipeline stages on a fixed synthetic dataset and gate on baselines.")
+    parser.add_argument("--history", default=HISTORY_DB, help="DuckDB file holding the run history and baselines.")
+    parser.add_argument("--rows-per-file", type=int, default=ROWS_PER_FILE)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("run", help="Run the benchmark, record it and compare to the baselines. Exits 1 on failure.")
+    p.add_argument("--work-dir", default=WORK_DIR)
+    p.add_argument("--time-tolerance", type=float, default=TIME_TOLERANCE)
+    p.add_argument("--memory-tolerance", type=float, default=MEMORY_TOLERANCE)
+
+    p = sub.add_parser("baseline", help="Set the baselines to the median of the most recent runs.")
+    p.add_argument("--runs", type=int, default=BASELINE_RUNS)
+
+    p = sub.add_parser("history", help="List recent runs.")
+    p.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        ok = gate(args.time_tolerance, args.memory_tolerance, args.work_dir, args.rows_per_file, args.history)
+        raise SystemExit(0 if ok else 1)
+    elif args.command == "baseline":
+        update_baselines(args.history, dataset_name(args.rows_per_file), args.runs)
+    else:
+        print_history(args.history, dataset_name(args.rows_per_file), args.limit)
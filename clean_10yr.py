@@ -1,6 +1,9 @@
 import duckdb
 import logging
 
+import governor
+from load_10yr import FINGERPRINT_COLUMN
+
 # --- Configuration ---
 logging.basicConfig(
     level=logging.INFO,
@@ -10,33 +13,187 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 DB_FILE = "emissions10yrs.duckdb"
 
-def clean_green_taxi_data():
+
+QUARANTINE_TABLE = "trip_quarantine"
+QUARANTINE_SAMPLE_TABLE = "trip_quarantine_sample"
+QUARANTINE_SAMPLE_ROWS = 10   # Rejected rows kept per (taxi type, month, reason)
+
+# Cleaning rules in evaluation order; a row is rejected for the first rule it fails.
+# A NULL in any rule counts as a failure, matching the WHERE clause it replaces.
+REJECT_RULES = [
+    ('no_passengers', "passenger_count > 0"),
+    ('zero_distance', "trip_distance > 0"),
+    ('distance_over_100', "trip_distance <= 100"),
+    ('duration_out_of_range', "EPOCH({prefix}_dropoff_datetime) - EPOCH({prefix}_pickup_datetime) BETWEEN 1 AND 86400"),
+]
+
+
+def clean_query(taxi_type, source_table):
+    """
+    Returns the cleaning SELECT for a taxi type: removes duplicates, trips with
+    0 passengers, 0 or >100 miles, or lasting outside 1 second to 1 day.
+    Contains a '{batch_filter}' placeholder (see governor.create_table_as).
+
+    Rows are still compared on the narrow trip columns rather than on the
+    fingerprint. That is exact, and DuckDB groups these fixed-width columns
+    faster than it groups on the fingerprint while carrying them as payload.
+    """
+    prefix = 'tpep' if taxi_type == 'yellow' else 'lpep'
+    conditions = "\n".join(f"                AND {condition.format(prefix=prefix)}" for _, condition in REJECT_RULES)
+    return f"""
+            SELECT DISTINCT
+                {prefix}_pickup_datetime,
+                {prefix}_dropoff_datetime,
+                passenger_count,
+                trip_distance,              -- To reduce size, only select necessary columns for cleaning
+                PULocationID,               -- Zone IDs are kept for spatial aggregation
+                DOLocationID,
+                -- Fingerprint computed at load time, carried for incremental dedup
+                {FINGERPRINT_COLUMN}
+            FROM 
+                {source_table}
+            WHERE 
+                {{batch_filter}}
+{conditions}
+        """
+
+
+def reject_reason_expr(taxi_type):
+    """CASE expression giving the first rule a raw row fails, or NULL if it passes every rule."""
+    prefix = 'tpep' if taxi_type == 'yellow' else 'lpep'
+    cases = "\n".join(
+        f"                    WHEN ({condition.format(prefix=prefix)}) IS NOT TRUE THEN '{reason}'"
+        for reason, condition in REJECT_RULES
+    )
+    return f"""CASE
+{cases}
+                END"""
+
+
+def quarantine_rejects(con, taxi_type, source_table, cleaned_table, source_file=None, source_month=None):
+    """
+    Records what the clean of source_table into cleaned_table dropped.
+    Per-month counts for every reason code (plus 'duplicate') go into
+    QUARANTINE_TABLE, and a small sample of the rejected rows goes into
+    QUARANTINE_SAMPLE_TABLE.
+
+    The reject counts and samples come from a second scan of the raw rows,
+    an aggregate with only a few groups per month. Duplicates are the rows
+    that pass every rule minus the distinct rows in cleaned_table. That scan
+    is not free: on 3M rows it takes about 0.5s next to 1.0s for the clean's
+    DISTINCT (tagging every row inside the DISTINCT instead took 1.9s).
+
+    A full clean (source_file=None) replaces the taxi type's whole quarantine.
+    A streamed file replaces only the rows recorded for that file, so months
+    from other files are kept, and re-ingesting a file does not double count.
+    Pass its nominal (year, month) as source_month to also replace the full
+    clean's rows (source_file NULL) for that month, so streaming a month the
+    full clean already covered does not count its rejects twice.
+    """
+    prefix = 'tpep' if taxi_type == 'yellow' else 'lpep'
+    pickup_col = f"{prefix}_pickup_datetime"
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {QUARANTINE_TABLE} (
+            taxi_type VARCHAR,
+            year INTEGER,
+            month INTEGER,
+            reason VARCHAR,
+            rows BIGINT,
+            source_file VARCHAR
+        )
+    """)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {QUARANTINE_SAMPLE_TABLE} (
+            taxi_type VARCHAR,
+            year INTEGER,
+            month INTEGER,
+            reason VARCHAR,
+            pickup_datetime TIMESTAMP,
+            dropoff_datetime TIMESTAMP,
+            passenger_count DOUBLE,
+            trip_distance DOUBLE,
+            PULocationID INTEGER,
+            DOLocationID INTEGER,
+            source_file VARCHAR
+        )
+    """)
+    scope = "taxi_type = ?" if source_file is None else "taxi_type = ? AND source_file = ?"
+    params = [taxi_type] if source_file is None else [taxi_type, source_file]
+    replaced, replaced_params = scope, params
+    if source_file is not None and source_month is not None:
+        replaced = "taxi_type = ? AND (source_file = ? OR (source_file IS NULL AND year = ? AND month = ?))"
+        replaced_params = params + list(source_month)
+    for table in (QUARANTINE_TABLE, QUARANTINE_SAMPLE_TABLE):
+        # Tables created before streamed files were quarantined lack the column
+        con.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS source_file VARCHAR")
+        con.execute(f"DELETE FROM {table} WHERE {replaced}", replaced_params)
+
+    # Every copy of a rejected row counts against its rule
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE quarantine_batch AS
+        SELECT
+            year({pickup_col}) AS year,
+            month({pickup_col}) AS month,
+            {reject_reason_expr(taxi_type)} AS reason,
+            COUNT(*) AS rows,
+            min_by({{
+                'pickup_datetime': {pickup_col},
+                'dropoff_datetime': {prefix}_dropoff_datetime,
+                'passenger_count': passenger_count,
+                'trip_distance': trip_distance,
+                'PULocationID': PULocationID,
+                'DOLocationID': DOLocationID
+            }}, {pickup_col}, {QUARANTINE_SAMPLE_ROWS}) AS sample
+        FROM {source_table}
+        GROUP BY ALL
+    """)
+    con.execute(f"""
+        INSERT INTO {QUARANTINE_TABLE}
+        SELECT '{taxi_type}', year, month, reason, rows, ?::VARCHAR
+        FROM quarantine_batch
+        WHERE reason IS NOT NULL
+        UNION ALL
+        SELECT '{taxi_type}', q.year, q.month, 'duplicate', q.rows - COALESCE(c.rows, 0), ?::VARCHAR
+        FROM quarantine_batch q
+        LEFT JOIN (
+            SELECT year({pickup_col}) AS year, month({pickup_col}) AS month, COUNT(*) AS rows
+            FROM {cleaned_table}
+            GROUP BY ALL
+        ) c ON c.year IS NOT DISTINCT FROM q.year AND c.month IS NOT DISTINCT FROM q.month
+        WHERE q.reason IS NULL AND q.rows > COALESCE(c.rows, 0)
+        ORDER BY 2, 3, 4
+    """, [source_file, source_file])
+    con.execute(f"""
+        INSERT INTO {QUARANTINE_SAMPLE_TABLE}
+        SELECT '{taxi_type}', year, month, reason, UNNEST(row, recursive := true), ?::VARCHAR
+        FROM (SELECT year, month, reason, UNNEST(sample) AS row FROM quarantine_batch WHERE reason IS NOT NULL)
+    """, [source_file])
+    con.execute("DROP TABLE quarantine_batch")
+
+    for reason, rows in con.execute(f"""
+        SELECT reason, SUM(rows) FROM {QUARANTINE_TABLE} WHERE {scope} GROUP BY reason ORDER BY reason
+    """, params).fetchall():
+        logger.info(f"Quarantined {rows:,} {taxi_type} rows for '{reason}'.")
+        print(f"Rejected for '{reason}': {rows:,}")
+
+
+def clean_green_taxi_data(db_file=DB_FILE):
     """
     Cleans and slims the yellow taxi dataset plus verification
     """
     print("\n--- Cleaning and Verifying Green Taxi Data ---")
     con = None
     try:
-        con = duckdb.connect(DB_FILE)
+        con = duckdb.connect(db_file)
+        governor.configure_connection(con, 'clean')
         source_table = "green_taxi_trips"
         cleaned_table = "green_taxi_trips_clean"
         
         logger.info(f"Cleaning and slimming data from '{source_table}' into '{cleaned_table}'.")
         
-        con.execute(f"""
-            CREATE OR REPLACE TABLE {cleaned_table} AS
-            SELECT DISTINCT
-                lpep_pickup_datetime,
-                lpep_dropoff_datetime,
-                passenger_count,
-                trip_distance               -- To reduce size, only select necessary columns for cleaning
-            FROM 
-                {source_table}
-            WHERE 
-                passenger_count > 0
-                AND trip_distance > 0 AND trip_distance <= 100
-                AND EPOCH(lpep_dropoff_datetime) - EPOCH(lpep_pickup_datetime) BETWEEN 1 AND 86400
-        """)
+        # Split into month batches automatically if the DISTINCT would not fit in memory
+        governor.create_table_as(con, cleaned_table, clean_query('green', source_table), source_table, 'lpep_pickup_datetime')
+        quarantine_rejects(con, 'green', source_table, cleaned_table)
         logger.info(f"Successfully created '{cleaned_table}'.")
 
         # --- Verification ---
@@ -66,34 +223,23 @@ def clean_green_taxi_data():
         if con:
             con.close()
 
-def clean_yellow_taxi_data():
+def clean_yellow_taxi_data(db_file=DB_FILE):
     """
     Cleans and slims the yellow taxi dataset plus verficiation
     """
     print("\n--- Cleaning and Verifying Yellow Taxi Data ---")
     con = None
     try:
-        con = duckdb.connect(DB_FILE)
-        con.execute("PRAGMA max_temp_directory_size = '20GiB'")
+        con = duckdb.connect(db_file)
+        governor.configure_connection(con, 'clean')
         source_table = "yellow_taxi_trips"
         cleaned_table = "yellow_taxi_trips_clean"
 
         logger.info(f"Cleaning and slimming data from '{source_table}' into '{cleaned_table}'.")
         
-        con.execute(f"""
-            CREATE OR REPLACE TABLE {cleaned_table} AS
-            SELECT DISTINCT
-                tpep_pickup_datetime,
-                tpep_dropoff_datetime,
-                passenger_count,
-                trip_distance
-            FROM 
-                {source_table}
-            WHERE 
-                passenger_count > 0
-                AND trip_distance > 0 AND trip_distance <= 100
-                AND EPOCH(tpep_dropoff_datetime) - EPOCH(tpep_pickup_datetime) BETWEEN 1 AND 86400
-        """)
+        # Split into month batches automatically if the DISTINCT would not fit in memory
+        governor.create_table_as(con, cleaned_table, clean_query('yellow', source_table), source_table, 'tpep_pickup_datetime')
+        quarantine_rejects(con, 'yellow', source_table, cleaned_table)
         logger.info(f"Successfully created '{cleaned_table}'.")
 
         # --- Verification ---
@@ -119,8 +265,12 @@ def clean_yellow_taxi_data():
     except Exception as e:
         print(f"An error occurred while cleaning yellow taxi data: {e}")
         logger.error(f"An error occurred while cleaning yellow taxi data: {e}")
+    finally:
+        if con:
+            con.close()
 
-if __name__ == "__main__":
+def main():
+    """Cleans both taxi types, then drops the raw tables."""
     clean_green_taxi_data()
     clean_yellow_taxi_data()
 
@@ -137,4 +287,8 @@ if __name__ == "__main__":
     except Exception as e:
         # This will catch errors from the cleaning functions if they fail
         print(f"\nProcess stopped due to an error. Original tables were NOT dropped.")
-        logger.error(f"Process stopped. Original tables were NOT dropped.")
\ No newline at end of file
+        logger.error(f"Process stopped. Original tables were NOT dropped.")
+
+
+if __name__ == "__main__":
+    main()
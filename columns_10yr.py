@@ -0,0 +1,203 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+
+# --- Configuration ---
+logger = logging.getLogger(__name__)
+DB_FILE = "emissions10yrs.duckdb"
+EXPORT_DIR = "columns"
+INDEX_FILE = "index.json"
+
+# Always exported; rows are sorted on it so every month is one contiguous slice
+PICKUP_COLUMN = 'pickup_datetime'
+DEFAULT_COLUMNS = ['trip_co2_kgs', 'avg_mph', 'trip_distance', 'passenger_count', 'hour_of_day',
+                   'day_of_week', 'month_of_year', 'PULocationID', 'DOLocationID']
+
+# DuckDB column type -> NumPy dtype of the exported array
+NUMPY_DTYPES = {
+    'DOUBLE': 'float64',
+    'FLOAT': 'float32',
+    'BIGINT': 'int64',
+    'INTEGER': 'int32',
+    'SMALLINT': 'int16',
+    'TINYINT': 'int8',
+    'UBIGINT': 'uint64',
+    'BOOLEAN': 'bool',
+    'TIMESTAMP': 'datetime64[us]',
+}
+# Calendar columns are BIGINT in the final tables; these fit a much smaller type
+NARROW_TYPES = {
+    'passenger_count': 'SMALLINT',
+    'hour_of_day': 'TINYINT',
+    'day_of_week': 'TINYINT',
+    'week_of_year': 'TINYINT',
+    'month_of_year': 'TINYINT',
+}
+
+
+def export_columns(con, taxi_type, columns=DEFAULT_COLUMNS, export_dir=EXPORT_DIR):
+    """
+    Writes columns of a final table as one fixed-width .npy file each, plus
+    an index.json with the row range of every pickup year/month. Rows are
+    sorted by pickup time and copied one month at a time into memory-mapped
+    output files, so memory use is bounded by the largest month. The export
+    is built next to the target and swapped in whole, so a reader never sees
+    a half-written export. NULLs become NaN in float columns and 0 elsewhere.
+
+    Returns:
+        str: The directory holding the export.
+    """
+    final_table = f"{taxi_type}_taxi_final"
+    pickup_col = 'tpep_pickup_datetime' if taxi_type == 'yellow' else 'lpep_pickup_datetime'
+    target_dir = os.path.join(export_dir, taxi_type)
+    staging_dir = f"{target_dir}.tmp"
+
+    table_types = {row[0]: row[1] for row in con.execute(f"DESCRIBE {final_table}").fetchall()}
+    selects = {PICKUP_COLUMN: pickup_col}
+    dtypes = {PICKUP_COLUMN: NUMPY_DTYPES['TIMESTAMP']}
+    for column in columns:
+        if column not in table_types:
+            raise ValueError(f"'{final_table}' has no column '{column}'.")
+        sql_type = NARROW_TYPES.get(column, table_types[column])
+        if sql_type not in NUMPY_DTYPES:
+            raise ValueError(f"Column '{column}' is {sql_type}; only fixed-width types can be exported.")
+        selects[column] = f"CAST({column} AS {sql_type})" if sql_type != table_types[column] else column
+        dtypes[column] = NUMPY_DTYPES[sql_type]
+
+    months = con.execute(f"""
+        SELECT year({pickup_col}) AS year, month({pickup_col}) AS month, COUNT(*) AS trips
+        FROM {final_table}
+        GROUP BY ALL
+        ORDER BY year, month
+    """).fetchall()
+    total_rows = sum(trips for _, _, trips in months)
+    logger.info(f"Exporting {len(selects)} columns of '{final_table}' ({total_rows:,} rows) to '{target_dir}'.")
+
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir)
+    arrays = {
+        name: np.lib.format.open_memmap(os.path.join(staging_dir, f"{name}.npy"), mode='w+', dtype=dtype, shape=(total_rows,))
+        for name, dtype in dtypes.items()
+    }
+    select_list = ", ".join(f"{expr} AS {name}" for name, expr in selects.items())
+    index = []
+    offset = 0
+    for year, month, trips in months:
+        next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+        batch = con.execute(f"""
+            SELECT {select_list}
+            FROM {final_table}
+            WHERE {pickup_col} >= TIMESTAMP '{year}-{month:02d}-01'
+              AND {pickup_col} < TIMESTAMP '{next_year}-{next_month:02d}-01'
+            ORDER BY {pickup_col}
+        """).fetchnumpy()
+        for name, values in batch.items():
+            if np.ma.isMaskedArray(values):
+                values = values.filled(np.nan if np.issubdtype(arrays[name].dtype, np.floating) else 0)
+            arrays[name][offset:offset + trips] = values
+        index.append({'year': year, 'month': month, 'start': offset, 'stop': offset + trips})
+        offset += trips
+
+    for array in arrays.values():
+        array.flush()
+    del arrays
+    with open(os.path.join(staging_dir, INDEX_FILE), 'w') as f:
+        json.dump({
+            'table': final_table,
+            'rows': total_rows,
+            'columns': dtypes,
+            'months': index,
+            'exported_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }, f, indent=1)
+
+    shutil.rmtree(target_dir, ignore_errors=True)
+    os.replace(staging_dir, target_dir)
+    logger.info(f"Exported {total_rows:,} rows of '{final_table}' to '{target_dir}'.")
+    print(f"Exported {total_rows:,} rows x {len(dtypes)} columns of '{final_table}' to '{target_dir}'.")
+    return target_dir
+
+
+def _month(value, end=False):
+    """Normalizes a range bound: (year, month), 'YYYY-MM', or a year (its first or last month)."""
+    if isinstance(value, int):
+        return (value, 12 if end else 1)
+    if isinstance(value, str):
+        year, month = value.split('-')
+        return (int(year), int(month))
+    return tuple(value)
+
+
+class ColumnStore:
+    """
+    Read-only access to one taxi type's exported columns. Each column is
+    memory-mapped on first use, so opening the store reads only the index,
+    and every process mapping the same files shares their page cache pages.
+    """
+
+    def __init__(self, taxi_type, export_dir=EXPORT_DIR):
+        self.path = os.path.join(export_dir, taxi_type)
+        with open(os.path.join(self.path, INDEX_FILE)) as f:
+            self.index = json.load(f)
+        self._arrays = {}
+
+    @property
+    def columns(self):
+        return list(self.index['columns'])
+
+    def __len__(self):
+        return self.index['rows']
+
+    def column(self, name):
+        """The whole column as a read-only memory-mapped array."""
+        if name not in self.index['columns']:
+            raise KeyError(f"Column '{name}' was not exported; available: {', '.join(self.columns)}.")
+        if name not in self._arrays:
+            self._arrays[name] = np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode='r')
+        return self._arrays[name]
+
+    def row_range(self, start=None, end=None):
+        """
+        Returns (first, stop) row positions covering the pickup months from
+        start through end, both inclusive; None leaves that side open.
+        """
+        months = self.index['months']
+        low = _month(start) if start is not None else None
+        high = _month(end, end=True) if end is not None else None
+        selected = [m for m in months
+                    if (low is None or (m['year'], m['month']) >= low)
+                    and (high is None or (m['year'], m['month']) <= high)]
+        if not selected:
+            return 0, 0
+        return selected[0]['start'], selected[-1]['stop']
+
+    def read(self, columns=None, start=None, end=None):
+        """
+        Returns {column: array} for a pickup month range, e.g.
+        read(['trip_co2_kgs', 'hour_of_day'], start='2020-03', end=2021).
+        The arrays are slices of the memory maps (views, not copies), so this
+        returns immediately whatever the size of the range.
+        """
+        first, stop = self.row_range(start, end)
+        return {name: self.column(name)[first:stop] for name in (columns or self.columns)}
+
+
+if __name__ == "__main__":
+    import duckdb
+
+    parser = argparse.ArgumentParser(description="Export final-table columns as memory-mappable NumPy files.")
+    parser.add_argument("--taxi", nargs="+", choices=["yellow", "green"], default=["yellow", "green"])
+    parser.add_argument("--columns", nargs="+", default=DEFAULT_COLUMNS)
+    parser.add_argument("--output-dir", default=EXPORT_DIR)
+    args = parser.parse_args()
+
+    con = duckdb.connect(DB_FILE, read_only=True)
+    try:
+        for taxi_type in args.taxi:
+            export_columns(con, taxi_type, args.columns, args.output_dir)
+    finally:
+        con.close()
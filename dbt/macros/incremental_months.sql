@@ -0,0 +1,27 @@
+{#
+    Incremental window for models keyed on pickup year/month.
+
+    On an incremental run only the newest month already in the target (it may
+    have been partial) and anything after it are selected. delete+insert on
+    the (year, month) key then replaces those months whole. Pass
+    --vars '{reprocess_from: "2020-01-01"}' to rebuild from an earlier month,
+    e.g. after a republished file, or --full-refresh to rebuild everything.
+
+    Pickups after the current time (bad clocks in the source files) are never
+    selected, and are ignored when finding the newest month of the target, so
+    a single future-dated trip cannot freeze the window at that month.
+#}
+{% macro incremental_months(timestamp_expr, target_timestamp_expr=none) %}
+    {%- set target_expr = target_timestamp_expr or timestamp_expr -%}
+    WHERE {{ timestamp_expr }} <= current_localtimestamp()
+    {%- if is_incremental() %}
+      AND {{ timestamp_expr }} >=
+        {%- if var('reprocess_from', none) %} TIMESTAMP '{{ var("reprocess_from") }}'
+        {%- else %} (
+            SELECT COALESCE(date_trunc('month', MAX({{ target_expr }})), TIMESTAMP '1900-01-01')
+            FROM {{ this }}
+            WHERE {{ target_expr }} <= current_localtimestamp()
+        )
+        {%- endif %}
+    {%- endif -%}
+{% endmacro %}
@@ -0,0 +1,46 @@
+{{ config(
+    materialized='incremental',
+    incremental_strategy='delete+insert',
+    unique_key=['taxi_type', 'year', 'month']
+) }}
+
+WITH trips AS (
+    -- Both staging models on common column names
+    SELECT
+        'yellow' AS taxi_type,
+        tpep_pickup_datetime AS pickup_datetime,
+        year,
+        month_of_year AS month,
+        trip_distance,
+        trip_co2_kgs,
+        avg_mph
+    FROM {{ ref('yellow_taxi') }}
+
+    UNION ALL
+
+    SELECT
+        'green' AS taxi_type,
+        lpep_pickup_datetime AS pickup_datetime,
+        year,
+        month_of_year AS month,
+        trip_distance,
+        trip_co2_kgs,
+        avg_mph
+    FROM {{ ref('green_taxi') }}
+)
+
+SELECT
+    taxi_type,
+    year,
+    month,
+    make_date(year, month, 1) AS month_start,
+    COUNT(*) AS trips,
+    SUM(trip_co2_kgs) AS co2_kgs,
+    SUM(trip_distance) AS distance_miles,
+    AVG(trip_co2_kgs) AS avg_co2_kgs_per_trip,
+    AVG(avg_mph) AS avg_mph
+FROM
+    trips
+{{ incremental_months('pickup_datetime', 'month_start') }}
+GROUP BY ALL
+ORDER BY taxi_type, year, month
@@ -1,16 +1,22 @@
-{{ config(materialized='table') }}
+{{ config(
+    materialized='incremental',
+    incremental_strategy='delete+insert',
+    unique_key=['year', 'month_of_year']
+) }}
 
 WITH trips AS (
     -- Source: cleaned green taxi trips
+    -- Incremental runs only read the newest loaded month onwards (zone maps skip the rest)
     SELECT *
     FROM {{ source('nyc_taxi', 'green_taxi_trips_clean') }}
+    {{ incremental_months('lpep_pickup_datetime') }}
 ),
 
 emissions AS (
     -- Source: vehicle emissions lookup table
     SELECT *
     FROM {{ source('nyc_taxi', 'vehicle_emissions') }}
-    WHERE vehicle_type = 'green'  -- Use the correct vehicle_type
+    WHERE vehicle_type = 'green_taxi'  -- Use the correct vehicle_type
 )
 
 SELECT
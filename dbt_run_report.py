@@ -0,0 +1,97 @@
+import argparse
+import json
+import logging
+from datetime import datetime
+
+# --- Configuration ---
+logger = logging.getLogger(__name__)
+RUN_RESULTS_PATH = "dbt/target/run_results.json"
+DB_FILE = "emissions10yrs.duckdb"
+
+
+def _seconds(timing, name):
+    """Duration of one timing phase ('compile' or 'execute') of a node, or None."""
+    for phase in timing:
+        if phase.get('name') == name and phase.get('started_at') and phase.get('completed_at'):
+            started = datetime.fromisoformat(phase['started_at'].replace('Z', '+00:00'))
+            completed = datetime.fromisoformat(phase['completed_at'].replace('Z', '+00:00'))
+            return (completed - started).total_seconds()
+    return None
+
+
+def parse_run_results(path=RUN_RESULTS_PATH):
+    """
+    Reads a dbt run_results.json and returns one dict per node with its name,
+    status, total/compile/execute seconds, rows affected (None when the
+    adapter does not report it) and relation name.
+
+    Returns:
+        tuple: (list of node dicts, total elapsed seconds of the invocation).
+    """
+    with open(path) as f:
+        run_results = json.load(f)
+
+    nodes = []
+    for result in run_results.get('results', []):
+        rows = (result.get('adapter_response') or {}).get('rows_affected')
+        nodes.append({
+            'name': result['unique_id'].split('.')[-1],
+            'unique_id': result['unique_id'],
+            'status': result.get('status'),
+            'seconds': result.get('execution_time') or 0.0,
+            'compile_seconds': _seconds(result.get('timing', []), 'compile'),
+            'execute_seconds': _seconds(result.get('timing', []), 'execute'),
+            'rows': rows if rows is not None and rows >= 0 else None,
+            'relation': result.get('relation_name'),
+        })
+    return nodes, run_results.get('elapsed_time') or 0.0
+
+
+def count_relation_rows(nodes, db_file=DB_FILE):
+    """
+    Fills in 'rows' for nodes whose adapter reported none, from the row count
+    of the materialized relation. For incremental models this is the table
+    size, not the rows the run touched.
+    """
+    import duckdb
+
+    con = duckdb.connect(db_file, read_only=True)
+    try:
+        for node in nodes:
+            if node['rows'] is None and node['relation'] and node['status'] == 'success':
+                # Relation names are quoted as "database"."schema"."table"; the attached file is the database
+                table = node['relation'].split('.')[-1].strip('"')
+                try:
+                    node['rows'] = con.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+                except Exception as e:
+                    logger.warning(f"Could not count rows of '{table}': {e}")
+    finally:
+        con.close()
+    return nodes
+
+
+def print_report(nodes, elapsed):
+    """Prints nodes slowest first with their share of the run and throughput."""
+    print(f"--- dbt run: {len(nodes)} nodes in {elapsed:.2f}s ---")
+    print(f"{'model':<28} {'status':<8} {'seconds':>8} {'share':>6} {'compile':>8} {'execute':>8} {'rows':>14} {'rows/s':>12}")
+    total = sum(node['seconds'] for node in nodes) or 1.0
+    for node in sorted(nodes, key=lambda n: n['seconds'], reverse=True):
+        rows = f"{node['rows']:,}" if node['rows'] is not None else "-"
+        rate = f"{node['rows'] / node['seconds']:,.0f}" if node['rows'] is not None and node['seconds'] else "-"
+        compile_s = f"{node['compile_seconds']:.2f}" if node['compile_seconds'] is not None else "-"
+        execute_s = f"{node['execute_seconds']:.2f}" if node['execute_seconds'] is not None else "-"
+        print(f"{node['name']:<28} {node['status']:<8} {node['seconds']:>8.2f} {node['seconds'] / total:>6.0%} "
+              f"{compile_s:>8} {execute_s:>8} {rows:>14} {rate:>12}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-model runtime and rows from dbt's run_results.json.")
+    parser.add_argument("--path", default=RUN_RESULTS_PATH)
+    parser.add_argument("--count-rows", action="store_true",
+                        help=f"Count rows of each built relation in {DB_FILE} when the adapter reports none.")
+    args = parser.parse_args()
+
+    nodes, elapsed = parse_run_results(args.path)
+    if args.count_rows:
+        count_relation_rows(nodes)
+    print_report(nodes, elapsed)
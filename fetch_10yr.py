@@ -0,0 +1,363 @@
+import argparse
+import asyncio
+import logging
+import os
+import random
+import re
+import struct
+import urllib.error
+import urllib.request
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from load_10yr import BASE_URL, FINGERPRINT_COLUMN, YEARS, fingerprint_expr
+
+# --- Configuration ---
+logger = logging.getLogger(__name__)
+
+FOOTER_PROBE_BYTES = 64 * 1024   # First suffix request; covers the footer of every TLC file
+CONCURRENCY = 8                  # Range requests in flight across all files
+FILE_CONCURRENCY = 4             # Monthly files being streamed at once
+MAX_RETRIES = 5
+BACKOFF_SECONDS = 1.0
+TIMEOUT_SECONDS = 60
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class MissingFileError(Exception):
+    """The requested monthly file does not exist (HTTP 404/403); not retried."""
+
+
+class _RangeBuffer:
+    """
+    Read-only, seekable file object over the byte ranges fetched so far.
+    pyarrow reads the footer and row groups through it without the whole
+    file ever being held in memory or written to disk.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.chunks = {}
+        self.pos = 0
+        self.closed = False
+
+    def add(self, start, data):
+        self.chunks[start] = data
+
+    def discard(self, start):
+        self.chunks.pop(start, None)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def writable(self):
+        return False
+
+    def seek(self, offset, whence=0):
+        base = {0: 0, 1: self.pos, 2: self.size}[whence]
+        self.pos = base + offset
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            n = self.size - self.pos
+        for start, data in self.chunks.items():
+            if start <= self.pos and self.pos + n <= start + len(data):
+                out = data[self.pos - start:self.pos - start + n]
+                self.pos += n
+                return out
+        raise IOError(f"Bytes {self.pos}-{self.pos + n} were not fetched")
+
+    def close(self):
+        self.closed = True
+
+
+def _http_get(url, byte_range):
+    """Blocking ranged GET. Returns (status, Content-Range header, body)."""
+    request = urllib.request.Request(url, headers={'Range': f'bytes={byte_range}'})
+    try:
+        with urllib.request.urlopen(request, timeout=TIMEOUT_SECONDS) as response:
+            return response.status, response.headers.get('Content-Range'), response.read()
+    except urllib.error.HTTPError as e:
+        if e.code in (403, 404):
+            raise MissingFileError(f"{url} returned HTTP {e.code}") from e
+        raise
+
+
+async def fetch_range(url, byte_range, semaphore):
+    """
+    Fetches one byte range ('start-end' or '-suffix') with retries and
+    exponential backoff plus jitter on timeouts, connection errors and
+    retryable HTTP statuses. The blocking request runs in a worker thread.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            async with semaphore:
+                return await asyncio.to_thread(_http_get, url, byte_range)
+        except MissingFileError:
+            raise
+        except (urllib.error.URLError, TimeoutError, ConnectionError) as e:
+            status = getattr(e, 'code', None)
+            if (status is not None and status not in RETRYABLE_STATUS) or attempt == MAX_RETRIES:
+                raise
+            delay = BACKOFF_SECONDS * 2 ** attempt * (0.5 + random.random())
+            logger.warning(f"Range {byte_range} of {url} failed ({e}); retry {attempt + 1}/{MAX_RETRIES} in {delay:.1f}s.")
+            await asyncio.sleep(delay)
+
+
+async def fetch_footer(url, semaphore):
+    """
+    Reads the Parquet footer with suffix range requests.
+
+    Returns:
+        tuple: (file size, footer start offset, footer bytes).
+    """
+    status, content_range, data = await fetch_range(url, f"-{FOOTER_PROBE_BYTES}", semaphore)
+    if status == 200:
+        # Server ignored the Range header and sent the whole file
+        return len(data), 0, data
+    size = int(content_range.rsplit('/', 1)[1])
+    footer_length = struct.unpack('<I', data[-8:-4])[0]
+    if data[-4:] != b'PAR1':
+        raise ValueError(f"{url} is not a Parquet file")
+    if footer_length + 8 > len(data):
+        start = size - footer_length - 8
+        _, _, data = await fetch_range(url, f"{start}-{size - 1}", semaphore)
+        return size, start, data
+    return size, size - len(data), data
+
+
+def _open_remote(size, footer_start, footer):
+    """
+    Opens a remote file from its fetched tail. The metadata is parsed from the
+    footer bytes directly, so pyarrow never issues its own footer reads.
+
+    Returns:
+        tuple: (_RangeBuffer, pyarrow.parquet.ParquetFile).
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    footer_length = struct.unpack('<I', footer[-8:-4])[0]
+    metadata = pq.read_metadata(pa.BufferReader(b'PAR1' + footer[-(footer_length + 8):]))
+    buffer = _RangeBuffer(size)
+    buffer.add(footer_start, footer)
+    return buffer, pq.ParquetFile(pa.PythonFile(buffer, mode='r'), metadata=metadata, pre_buffer=False)
+
+
+def row_group_ranges(metadata):
+    """Returns the contiguous (start, end) byte range of every row group's column chunks."""
+    ranges = []
+    for i in range(metadata.num_row_groups):
+        row_group = metadata.row_group(i)
+        starts, ends = [], []
+        for j in range(row_group.num_columns):
+            column = row_group.column(j)
+            start = column.data_page_offset
+            if column.has_dictionary_page and column.dictionary_page_offset:
+                start = min(start, column.dictionary_page_offset)
+            starts.append(start)
+            ends.append(start + column.total_compressed_size)
+        ranges.append((min(starts), max(ends)))
+    return ranges
+
+
+async def stream_parquet(url, semaphore, on_batch):
+    """
+    Streams one remote Parquet file into on_batch(arrow_table), one row group
+    at a time: footer first, then every row group fetched concurrently and
+    decoded as soon as its bytes arrive.
+
+    Returns:
+        int: Rows handed to on_batch.
+    """
+    size, footer_start, footer = await fetch_footer(url, semaphore)
+    buffer, parquet_file = _open_remote(size, footer_start, footer)
+    decode_lock = asyncio.Lock()  # ParquetFile is not safe to read from two threads at once
+
+    async def one_row_group(index, start, end):
+        if footer_start <= start and end <= size:
+            data = None  # Already fetched with the footer (small files)
+        else:
+            _, _, data = await fetch_range(url, f"{start}-{end - 1}", semaphore)
+        async with decode_lock:
+            if data is not None:
+                buffer.add(start, data)
+            table = await asyncio.to_thread(parquet_file.read_row_group, index)
+            if data is not None:
+                buffer.discard(start)
+            on_batch(table)
+        return table.num_rows
+
+    tasks = [
+        asyncio.ensure_future(one_row_group(i, start, end))
+        for i, (start, end) in enumerate(row_group_ranges(parquet_file.metadata))
+    ]
+    try:
+        counts = await asyncio.gather(*tasks)
+    except BaseException:
+        # Stop the other row groups, so nothing reaches on_batch once the file has failed
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    return sum(counts)
+
+
+async def fetch_schema(url, semaphore):
+    """Returns the Arrow schema of a remote Parquet file from its footer alone."""
+    size, footer_start, footer = await fetch_footer(url, semaphore)
+    return _open_remote(size, footer_start, footer)[1].schema_arrow
+
+
+async def _load_taxi_data(con, taxi_type, years, base_url):
+    table_name = f"{taxi_type}_taxi_trips"
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    file_slots = asyncio.Semaphore(FILE_CONCURRENCY)
+
+    # Create an empty table based on the schema of a recent file (footer only)
+    schema = await fetch_schema(f"{base_url}/{taxi_type}_tripdata_2024-01.parquet", semaphore)
+    empty = schema.empty_table()
+    con.register('schema_batch', empty)
+    con.execute(f"CREATE TABLE IF NOT EXISTS {table_name} AS SELECT * FROM schema_batch")
+    con.unregister('schema_batch')
+    con.execute(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {FINGERPRINT_COLUMN} UBIGINT")
+    fingerprint = fingerprint_expr(con, table_name, taxi_type)
+    logger.info(f"Successfully created empty table '{table_name}'.")
+
+    async def one_month(year, month):
+        url = f"{base_url}/{taxi_type}_tripdata_{year}-{month:02d}.parquet"
+        # Row groups are staged per month and only reach the table once the whole file has arrived
+        staging_table = f"stage_{taxi_type}_{year}_{month:02d}"
+
+        def insert(batch):
+            # Called on the event loop thread only, so the connection is never shared across threads
+            con.register(f'{staging_table}_batch', batch)
+            con.execute(f"INSERT INTO {staging_table} SELECT *, {fingerprint} FROM {staging_table}_batch")
+            con.unregister(f'{staging_table}_batch')
+
+        async with file_slots:
+            con.execute(f"CREATE OR REPLACE TEMP TABLE {staging_table} AS SELECT * FROM {table_name} LIMIT 0")
+            try:
+                await stream_parquet(url, semaphore, insert)
+                rows = con.execute(f"INSERT INTO {table_name} SELECT * FROM {staging_table}").fetchone()[0]
+                logger.info(f"Successfully inserted {rows:,} records for {year}-{month:02d}.")
+                return rows, True
+            except Exception as e:
+                logger.warning(f"Could not load data for {year}-{month:02d} ({taxi_type}). Skipping. Error: {e}")
+                return 0, False
+            finally:
+                con.execute(f"DROP TABLE IF EXISTS {staging_table}")
+
+    results = await asyncio.gather(*(one_month(year, month) for year in years for month in range(1, 13)))
+    return results
+
+
+def load_taxi_data_async(con, taxi_type, years=YEARS, base_url=BASE_URL):
+    """
+    Drop-in alternative to load_10yr.load_taxi_data. It streams every monthly
+    file concurrently with HTTP range requests: the footer first, then the
+    row groups in parallel. Failed requests are retried with backoff, and
+    decoded Arrow batches go straight into DuckDB. Each month lands in a
+    temporary table first and is appended only once the whole file arrived,
+    so a file that fails part-way leaves no rows behind.
+
+    Returns:
+        int: Total rows inserted.
+    """
+    table_name = f"{taxi_type}_taxi_trips"
+    logger.info(f"--- Starting to stream data for {table_name} ---")
+    results = asyncio.run(_load_taxi_data(con, taxi_type, years, base_url))
+    total = sum(rows for rows, _ in results)
+    failed = sum(1 for _, ok in results if not ok)
+    logger.info(f"--- Finished loading for {table_name}. Total records inserted: {total:,}; months skipped: {failed} ---")
+    print(f"Loaded {total:,} {taxi_type} records ({failed} months skipped).")
+    return total
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Local stand-in for the TLC endpoint: serves a directory with single-range
+    'Range: bytes=...' support. fail_rate injects random 503s to exercise retries.
+    """
+    fail_rate = 0.0
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def send_head(self):
+        if self.fail_rate and random.random() < self.fail_rate:
+            self.send_error(503, "Injected failure")
+            return None
+        match = re.fullmatch(r'bytes=(\d*)-(\d*)', self.headers.get('Range', ''))
+        path = self.translate_path(self.path)
+        if not match or not os.path.isfile(path):
+            return super().send_head()
+
+        size = os.path.getsize(path)
+        first, last = match.groups()
+        if first:
+            start, end = int(first), min(int(last) if last else size - 1, size - 1)
+        else:
+            start, end = max(size - int(last), 0), size - 1
+        f = open(path, 'rb')
+        f.seek(start)
+        self.send_response(206)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        self._remaining = end - start + 1
+        return f
+
+    def copyfile(self, source, outputfile):
+        remaining = getattr(self, '_remaining', None)
+        if remaining is None:
+            return super().copyfile(source, outputfile)
+        outputfile.write(source.read(remaining))
+
+
+def serve(directory, port=8000, fail_rate=0.0):
+    """Serves `directory` over HTTP with range support until interrupted."""
+    handler = partial(type('Handler', (RangeRequestHandler,), {'fail_rate': fail_rate}), directory=directory)
+    with ThreadingHTTPServer(('127.0.0.1', port), handler) as server:
+        print(f"Serving '{directory}' at http://127.0.0.1:{port} (fail rate {fail_rate:.0%})")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    import duckdb
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        filename='load.log',
+    )
+    parser = argparse.ArgumentParser(description="Async range-request loader for monthly TLC trip files.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    load_cmd = sub.add_parser("load", help="Stream monthly files into the database.")
+    load_cmd.add_argument("--taxi", nargs="+", choices=["yellow", "green"], default=["yellow", "green"])
+    load_cmd.add_argument("--base-url", default=BASE_URL)
+    load_cmd.add_argument("--db", default="emissions10yrs.duckdb")
+    serve_cmd = sub.add_parser("serve", help="Run a local range-capable stand-in for the TLC endpoint.")
+    serve_cmd.add_argument("--dir", required=True)
+    serve_cmd.add_argument("--port", type=int, default=8000)
+    serve_cmd.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.dir, args.port, args.fail_rate)
+    else:
+        con = duckdb.connect(args.db)
+        try:
+            for taxi_type in args.taxi:
+                load_taxi_data_async(con, taxi_type, base_url=args.base_url)
+        finally:
+            con.close()
@@ -0,0 +1,211 @@
+import logging
+import os
+import shutil
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+TEMP_DIRECTORY = "duckdb_tmp"
+GIB = 1024 ** 3
+
+# Share of usable RAM each stage may hand to DuckDB. The rest is left for the
+# OS page cache, Python and (for analysis) matplotlib.
+STAGE_MEMORY_FRACTION = {
+    'load': 0.5,
+    'clean': 0.75,
+    'transform': 0.75,
+    'analysis': 0.5,
+}
+
+# Rough in-memory footprint of one value in a DISTINCT / join hash table,
+# including hash, pointer and string overhead. Deliberately pessimistic.
+BYTES_PER_VALUE = 32
+
+# Number of pipeline processes sharing this machine (see set_process_share)
+_PROCESS_SHARE = 1
+
+# Environment overrides, e.g. TAXI_CO2_MEMORY_LIMIT=12GB TAXI_CO2_THREADS=4
+ENV_MEMORY_LIMIT = "TAXI_CO2_MEMORY_LIMIT"
+ENV_THREADS = "TAXI_CO2_THREADS"
+ENV_TEMP_DIRECTORY = "TAXI_CO2_TEMP_DIR"
+ENV_MAX_TEMP_SIZE = "TAXI_CO2_MAX_TEMP_SIZE"
+
+
+def detect_memory_bytes():
+    """
+    Returns usable RAM in bytes: physical memory, capped by a cgroup (container)
+    limit when one is set.
+    """
+    try:
+        total = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        total = 8 * GIB
+        logger.warning("Could not detect physical memory; assuming 8 GiB.")
+
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+            if value.isdigit() and int(value) < total:
+                total = int(value)
+        except OSError:
+            continue
+    return total
+
+
+def detect_cores():
+    """Returns the number of cores this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def set_process_share(processes):
+    """
+    Declares that `processes` pipeline processes run side by side on this
+    machine, so each one only takes its share of memory and cores.
+    """
+    global _PROCESS_SHARE
+    _PROCESS_SHARE = max(1, int(processes))
+
+
+def _parse_bytes(text):
+    """Parses sizes like '12GB', '512MiB' or '2000000' into bytes."""
+    units = {'KB': 1000, 'MB': 1000 ** 2, 'GB': 1000 ** 3, 'TB': 1000 ** 4,
+             'KIB': 1024, 'MIB': 1024 ** 2, 'GIB': 1024 ** 3, 'TIB': 1024 ** 4, 'B': 1}
+    text = text.strip().upper()
+    for unit in sorted(units, key=len, reverse=True):
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * units[unit])
+    return int(text)
+
+
+def stage_settings(stage):
+    """
+    Computes the DuckDB settings for a pipeline stage from the detected
+    machine resources and any environment overrides.
+
+    Returns:
+        dict: memory_limit_bytes, threads, temp_directory, max_temp_directory_bytes.
+    """
+    memory = detect_memory_bytes()
+    memory_limit = int(memory * STAGE_MEMORY_FRACTION.get(stage, 0.5)) // _PROCESS_SHARE
+    if os.environ.get(ENV_MEMORY_LIMIT):
+        memory_limit = _parse_bytes(os.environ[ENV_MEMORY_LIMIT])
+
+    threads = int(os.environ.get(ENV_THREADS) or max(1, detect_cores() // _PROCESS_SHARE))
+    temp_directory = os.environ.get(ENV_TEMP_DIRECTORY) or TEMP_DIRECTORY
+
+    if os.environ.get(ENV_MAX_TEMP_SIZE):
+        max_temp = _parse_bytes(os.environ[ENV_MAX_TEMP_SIZE])
+    else:
+        # Leave 20% of the temp volume free for the database file itself
+        volume = os.path.dirname(os.path.abspath(temp_directory))
+        max_temp = int(shutil.disk_usage(volume).free * 0.8)
+
+    return {
+        'memory_limit_bytes': memory_limit,
+        'threads': threads,
+        'temp_directory': temp_directory,
+        'max_temp_directory_bytes': max_temp,
+    }
+
+
+def configure_connection(con, stage):
+    """
+    Applies the stage's memory, thread and spill settings to a DuckDB connection.
+
+    Returns:
+        dict: The settings that were applied (see stage_settings).
+    """
+    settings = stage_settings(stage)
+    con.execute(f"SET memory_limit = '{settings['memory_limit_bytes'] // (1024 ** 2)}MiB'")
+    con.execute(f"SET threads = {settings['threads']}")
+    con.execute(f"SET temp_directory = '{settings['temp_directory']}'")
+    con.execute(f"SET max_temp_directory_size = '{settings['max_temp_directory_bytes'] // (1024 ** 2)}MiB'")
+    # Heavy stages do not need input order preserved; dropping it lets DuckDB
+    # stream CREATE TABLE AS / INSERT without buffering whole partitions.
+    if stage in ('clean', 'transform'):
+        con.execute("SET preserve_insertion_order = false")
+
+    logger.info(
+        f"Configured '{stage}' stage: memory_limit={settings['memory_limit_bytes'] / GIB:.1f} GiB, "
+        f"threads={settings['threads']}, temp_directory='{settings['temp_directory']}', "
+        f"max_temp_directory_size={settings['max_temp_directory_bytes'] / GIB:.1f} GiB"
+    )
+    return settings
+
+
+def _memory_limit_bytes(con):
+    """Reads the connection's current memory_limit back from DuckDB."""
+    value = con.execute("SELECT current_setting('memory_limit')").fetchone()[0]
+    return _parse_bytes(value.replace(' ', ''))
+
+
+def estimate_bytes(con, table_name):
+    """Estimates the hash-table footprint of a full-table DISTINCT or join."""
+    row = con.execute("""
+        SELECT estimated_size, column_count FROM duckdb_tables()
+        WHERE table_name = ? AND database_name = current_database()
+    """, [table_name]).fetchone()
+    if not row:
+        return 0
+    return row[0] * row[1] * BYTES_PER_VALUE
+
+
+def month_batches(con, source_table, date_col):
+    """
+    Returns one SQL predicate per calendar month present in the source table
+    (plus one for NULL timestamps). Range predicates let zone maps skip row
+    groups outside the month.
+    """
+    months = con.execute(f"""
+        SELECT DISTINCT CAST(date_trunc('month', {date_col}) AS DATE) AS month
+        FROM {source_table}
+        ORDER BY month NULLS LAST
+    """).fetchall()
+
+    predicates = []
+    for (month,) in months:
+        if month is None:
+            predicates.append(f"{date_col} IS NULL")
+            continue
+        next_month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+        predicates.append(f"{date_col} >= TIMESTAMP '{month}' AND {date_col} < TIMESTAMP '{next_month}'")
+    return predicates
+
+
+def create_table_as(con, target_table, select_sql, source_table, date_col):
+    """
+    Runs CREATE OR REPLACE TABLE target AS select_sql, splitting it into month
+    batches when the estimated footprint exceeds the connection's memory limit.
+
+    select_sql must contain a '{batch_filter}' placeholder inside its WHERE
+    clause. It is replaced by TRUE for a single statement, or by a per-month
+    range predicate on date_col when batching. Batching by pickup month is
+    exact for DISTINCT because duplicate rows share the same pickup time.
+
+    Returns:
+        int: The number of statements executed (1 when not batched).
+    """
+    estimate = estimate_bytes(con, source_table)
+    budget = _memory_limit_bytes(con)
+
+    if estimate <= budget:
+        con.execute(f"CREATE OR REPLACE TABLE {target_table} AS {select_sql.format(batch_filter='TRUE')}")
+        return 1
+
+    predicates = month_batches(con, source_table, date_col)
+    logger.info(
+        f"Estimated {estimate / GIB:.1f} GiB for '{target_table}' exceeds the "
+        f"{budget / GIB:.1f} GiB budget; running in {len(predicates)} month batches."
+    )
+    print(f"Building '{target_table}' in {len(predicates)} month batches to stay within memory.")
+
+    # Create from the first batch (possibly empty) so the schema comes from the query itself
+    first = predicates[0] if predicates else 'FALSE'
+    con.execute(f"CREATE OR REPLACE TABLE {target_table} AS {select_sql.format(batch_filter=first)}")
+    for predicate in predicates[1:]:
+        con.execute(f"INSERT INTO {target_table} {select_sql.format(batch_filter=predicate)}")
+    return max(len(predicates), 1)
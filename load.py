@@ -3,7 +3,6 @@ import os
 import logging
 import requests
 import io
-import pandas as pd
 
 """
 Complete the load.py script to create a local, persistent DuckDB database that creates and loads (at most) three tables:
@@ -163,13 +162,10 @@ def create_emissions_lookup(con, csv_path):
     """
     logger.info(f"Creating or replacing 'vehicle_emissions' table from {csv_path}...")
     try:
-        # Read the CSV file into a pandas DataFrame
-        emissions_df = pd.read_csv(csv_path)
-        
-        # Create a permanent table in DuckDB directly from the DataFrame
-        con.execute("""
+        # Create a permanent table in DuckDB directly from the CSV file
+        con.execute(f"""
             CREATE OR REPLACE TABLE vehicle_emissions AS 
-            SELECT * FROM emissions_df
+            SELECT * FROM read_csv('{csv_path}', header = true)
         """)
 
         # Verification
@@ -2,7 +2,8 @@ import duckdb
 import os
 import logging
 import time
-import pandas as pd
+
+import governor
 
 # --- Configuration ---
 logging.basicConfig(
@@ -14,25 +15,60 @@ logger = logging.getLogger(__name__)
 DB_FILE = "emissions10yrs.duckdb"
 BASE_URL = "https://d37ci6vzurychx.cloudfront.net/trip-data"
 EMISSIONS_CSV_PATH = 'data/vehicle_emissions.csv'
+YEARS = range(2015, 2025)
+MONTHS = range(1, 13)
+PAUSE_SECONDS = 10  # Rate limit between downloads from the TLC endpoint
+FINGERPRINT_COLUMN = 'trip_fingerprint'
+
+
+def trip_columns(taxi_type):
+    """The canonical columns that identify a trip (the ones cleaning deduplicates on)."""
+    prefix = 'tpep' if taxi_type == 'yellow' else 'lpep'
+    return [f'{prefix}_pickup_datetime', f'{prefix}_dropoff_datetime', 'passenger_count',
+            'trip_distance', 'PULocationID', 'DOLocationID']
+
 
+def fingerprint_expr(con, relation, taxi_type):
+    """
+    Returns the SQL expression for a trip's 64-bit fingerprint: DuckDB's hash()
+    over the canonical trip columns. Each column is cast to its type in
+    `relation` (a table name or e.g. "read_parquet('...')") first, so the same
+    trip read from files with different physical types hashes identically.
+    Equal trips always share a fingerprint; distinct trips can collide, so
+    consumers must verify matches on the columns themselves.
+    """
+    types = {row[0]: row[1] for row in con.execute(f"DESCRIBE SELECT * FROM {relation}").fetchall()}
+    columns = trip_columns(taxi_type)
+    return f"hash({', '.join(f'CAST({c} AS {types[c]})' for c in columns)})"
 
-def load_taxi_data(con, taxi_type):
+
+def load_taxi_data(con, taxi_type, years=YEARS, base_url=BASE_URL, months=MONTHS, pause_seconds=PAUSE_SECONDS):
     """
     Loads taxi data for a specific type (yellow or green) into the database.
     Includes a pause after each file download to rate limit requests.
+
+    Args:
+        con: An active DuckDB connection.
+        taxi_type (str): The type of taxi data to load ('yellow' or 'green').
+        years (iterable): The years to load (defaults to 2015-2024).
+        base_url (str): Where the monthly files live; a local directory works too.
+        months (iterable): The months of each year to load (defaults to all 12).
+        pause_seconds (float): Pause after each file; 0 for local files.
     """
     table_name = f"{taxi_type}_taxi_trips"
-    years = range(2015, 2025)
     
     logger.info(f"--- Starting to load data for {table_name} ---")
     
     # Create an empty table based on the schema of a recent file
     try:
-        schema_url = f"{BASE_URL}/{taxi_type}_tripdata_2024-01.parquet"
+        schema_url = f"{base_url}/{taxi_type}_tripdata_2024-01.parquet"
         con.execute(f"""
             CREATE TABLE IF NOT EXISTS {table_name} AS 
             SELECT * FROM read_parquet('{schema_url}') LIMIT 0;
         """)
+        # Fingerprint is computed once here so every later dedup compares one integer
+        con.execute(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {FINGERPRINT_COLUMN} UBIGINT")
+        fingerprint = fingerprint_expr(con, table_name, taxi_type)
         logger.info(f"Successfully created empty table '{table_name}'.")
     except Exception as e:
         logger.critical(f"Could not create table schema for {table_name}. Aborting. Error: {e}")
@@ -41,15 +77,15 @@ def load_taxi_data(con, taxi_type):
     total_inserted_count = 0
     # Loop through all years and months to load data
     for year in years:
-        for month in range(1, 13):
-            url = f"{BASE_URL}/{taxi_type}_tripdata_{year}-{month:02d}.parquet"
+        for month in months:
+            url = f"{base_url}/{taxi_type}_tripdata_{year}-{month:02d}.parquet"
             logger.info(f"Processing {url}...")
             
             try:
                 # Insert data directly from the URL into the table
                 result = con.execute(f"""
                     INSERT INTO {table_name}
-                    SELECT * FROM read_parquet('{url}')
+                    SELECT *, {fingerprint} FROM read_parquet('{url}')
                 """).fetchone()
 
                 inserted_for_month = result[0] if result else 0
@@ -57,7 +93,7 @@ def load_taxi_data(con, taxi_type):
                 logger.info(f"Successfully inserted {inserted_for_month:,} records for {year}-{month:02d}.")
 
                 # --- ADDED SLEEP ---
-                time.sleep(10)
+                time.sleep(pause_seconds)
 
             except Exception as e:
                 logger.warning(f"Could not load data for {year}-{month:02d} ({taxi_type}). Skipping. Error: {e}")
@@ -71,8 +107,8 @@ def create_emissions_lookup(con, csv_path):
     """
     logger.info(f"Creating or replacing 'vehicle_emissions' table from {csv_path}...")
     try:
-        emissions_df = pd.read_csv(csv_path)
-        con.execute("CREATE OR REPLACE TABLE vehicle_emissions AS SELECT * FROM emissions_df")
+        # DuckDB's native CSV reader: no pandas import needed for a 9-row lookup
+        con.execute(f"CREATE OR REPLACE TABLE vehicle_emissions AS SELECT * FROM read_csv('{csv_path}', header = true)")
         count = con.execute("SELECT COUNT(*) FROM vehicle_emissions").fetchone()[0]
         logger.info(f"Successfully created 'vehicle_emissions' table with {count} records.")
         print(f"Loaded {count} vehicle emission records.")
@@ -121,6 +157,7 @@ def main():
     try:
         print("--- Starting Data Loading Pipeline ---")
         con = duckdb.connect(database=DB_FILE)
+        governor.configure_connection(con, 'load')
         logger.info(f"Successfully connected to DuckDB at '{DB_FILE}'")
 
         # --- STEP 1: Load Yellow Taxi Data ---
@@ -0,0 +1,269 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# --- Configuration ---
+logger = logging.getLogger(__name__)
+
+TAXI_TYPES = ['yellow', 'green']
+TAXI_COLORS = {'yellow': 'gold', 'green': 'green'}
+TAXI_STYLES = {'yellow': dict(marker='o', linestyle='-'), 'green': dict(marker='s', linestyle='--')}
+MONTHS = np.arange(1, 13)
+DAY_LABELS = ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat']
+
+# One row per (taxi_type, year, month, day_of_week, hour_of_day). Every chart in
+# a report is derived from this single result, so the database is scanned once.
+AGGREGATE_QUERY = """
+    SELECT
+        '{taxi_type}' AS taxi_type,
+        year({pickup_col}) AS year,
+        month_of_year AS month,
+        day_of_week,
+        hour_of_day,
+        COUNT(*) AS trips,
+        SUM(trip_co2_kgs) AS co2_kgs
+    FROM {table_name}
+    GROUP BY ALL
+"""
+
+# Figure reused by every chart rendered in this process (one per pool worker)
+_FIGURE = None
+_WORKER_FRAME = None
+
+
+def fetch_aggregate(con, table_template="{taxi_type}_taxi_final"):
+    """
+    Runs the aggregate query for both taxi types and returns it as a columnar
+    frame: a dict mapping column name to a NumPy array.
+    """
+    parts = []
+    for taxi_type in TAXI_TYPES:
+        pickup_col = 'tpep_pickup_datetime' if taxi_type == 'yellow' else 'lpep_pickup_datetime'
+        parts.append(AGGREGATE_QUERY.format(
+            taxi_type=taxi_type,
+            pickup_col=pickup_col,
+            table_name=table_template.format(taxi_type=taxi_type),
+        ))
+    frame = con.execute(" UNION ALL ".join(parts)).fetchnumpy()
+    frame = {name: np.asarray(values) for name, values in frame.items()}
+    logger.info(f"Fetched plotting aggregate with {len(frame['trips']):,} rows.")
+    return frame
+
+
+def _bincount(frame, mask, key, size, weights='co2_kgs'):
+    """Sums a weight column into `size` buckets indexed by an integer key column."""
+    return np.bincount(frame[key][mask].astype(np.int64), weights=frame[weights][mask], minlength=size)[:size]
+
+
+def _years(frame):
+    return np.unique(frame['year']).astype(int)
+
+
+def _plot_seasonal(fig, frame, spec):
+    """All years collapsed into 12 monthly totals, one line per taxi type."""
+    ax = fig.add_subplot()
+    for taxi_type in TAXI_TYPES:
+        mask = frame['taxi_type'] == taxi_type
+        totals = _bincount(frame, mask, 'month', 13)[1:]
+        ax.plot(MONTHS, totals, label=f'{taxi_type.capitalize()} Taxi CO2',
+                color=TAXI_COLORS[taxi_type], **TAXI_STYLES[taxi_type])
+    ax.set_title(spec.get('title', 'Total Monthly CO2 Emissions by Taxi Type'), fontsize=16)
+    ax.set_xlabel('Month of the Year', fontsize=12)
+    ax.set_ylabel('Total CO2 (kgs)', fontsize=12)
+    ax.set_xticks(MONTHS)
+    ax.legend()
+    ax.grid(True, which='both', linestyle='--', linewidth=0.5)
+
+
+def _plot_monthly(fig, frame, spec):
+    """Monthly totals for a single year, one line per taxi type."""
+    year = spec['year']
+    ax = fig.add_subplot()
+    for taxi_type in TAXI_TYPES:
+        mask = (frame['taxi_type'] == taxi_type) & (frame['year'] == year)
+        totals = _bincount(frame, mask, 'month', 13)[1:]
+        ax.plot(MONTHS, totals, label=f'{taxi_type.capitalize()} Taxi CO2',
+                color=TAXI_COLORS[taxi_type], **TAXI_STYLES[taxi_type])
+    ax.set_title(spec.get('title', f'Total Monthly CO2 Emissions by Taxi Type ({year})'), fontsize=16)
+    ax.set_xlabel('Month of the Year', fontsize=12)
+    ax.set_ylabel('Total CO2 (kgs)', fontsize=12)
+    ax.set_xticks(MONTHS)
+    ax.legend()
+    ax.grid(True, which='both', linestyle='--', linewidth=0.5)
+
+
+def _plot_heatmap(fig, frame, spec):
+    """Day-of-week x hour-of-day CO2 totals for one taxi type (optionally one year)."""
+    taxi_type = spec['taxi_type']
+    mask = frame['taxi_type'] == taxi_type
+    if spec.get('year') is not None:
+        mask &= frame['year'] == spec['year']
+    cell = frame['day_of_week'].astype(np.int64) * 24 + frame['hour_of_day'].astype(np.int64)
+    grid = np.bincount(cell[mask], weights=frame['co2_kgs'][mask], minlength=7 * 24)[:7 * 24].reshape(7, 24)
+
+    ax = fig.add_subplot()
+    image = ax.imshow(grid, aspect='auto', cmap='viridis')
+    fig.colorbar(image, ax=ax, label='Total CO2 (kgs)')
+    period = spec['year'] if spec.get('year') is not None else 'All Years'
+    ax.set_title(spec.get('title', f'{taxi_type.capitalize()} Taxi CO2 by Hour and Day of Week ({period})'), fontsize=16)
+    ax.set_xlabel('Hour of the Day', fontsize=12)
+    ax.set_ylabel('Day of the Week', fontsize=12)
+    ax.set_xticks(np.arange(24))
+    ax.set_yticks(np.arange(7), DAY_LABELS)
+
+
+def _plot_yoy(fig, frame, spec):
+    """Yearly CO2 totals per taxi type, annotated with the year-over-year change."""
+    years = _years(frame)
+    ax = fig.add_subplot()
+    for taxi_type in TAXI_TYPES:
+        mask = frame['taxi_type'] == taxi_type
+        index = np.searchsorted(years, frame['year'][mask].astype(int))
+        totals = np.bincount(index, weights=frame['co2_kgs'][mask], minlength=len(years))
+        ax.plot(years, totals, label=f'{taxi_type.capitalize()} Taxi CO2',
+                color=TAXI_COLORS[taxi_type], **TAXI_STYLES[taxi_type])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            change = np.diff(totals) / totals[:-1] * 100
+        for year, total, pct in zip(years[1:], totals[1:], change):
+            if np.isfinite(pct):
+                ax.annotate(f'{pct:+.0f}%', (year, total), textcoords='offset points', xytext=(0, 6),
+                            ha='center', fontsize=8, color=TAXI_COLORS[taxi_type])
+    ax.set_title(spec.get('title', 'Year-over-Year CO2 Emissions by Taxi Type'), fontsize=16)
+    ax.set_xlabel('Year', fontsize=12)
+    ax.set_ylabel('Total CO2 (kgs)', fontsize=12)
+    ax.set_xticks(years)
+    ax.legend()
+    ax.grid(True, which='both', linestyle='--', linewidth=0.5)
+
+
+def _plot_timeseries(fig, frame, spec):
+    """
+    Monthly CO2 series with its rolling average and trend, one panel per taxi
+    type. Expects the frame from timeseries_10yr.fetch_monthly_series.
+    """
+    axes = fig.subplots(len(TAXI_TYPES), 1, sharex=True)
+    for ax, taxi_type in zip(axes, TAXI_TYPES):
+        mask = frame['taxi_type'] == taxi_type
+        dates = frame['period_start'][mask]
+        ax.plot(dates, frame['co2_kgs'][mask], label='Monthly CO2', color=TAXI_COLORS[taxi_type])
+        ax.plot(dates, frame['co2_rolling_avg'][mask], label='12-Month Rolling Avg', color='gray', linestyle='--')
+        ax.plot(dates, frame['trend'][mask], label='Trend', color='black')
+        ax.set_title(f'{taxi_type.capitalize()} Taxi', fontsize=12)
+        ax.set_ylabel('Total CO2 (kgs)', fontsize=12)
+        ax.legend()
+        ax.grid(True, which='both', linestyle='--', linewidth=0.5)
+    axes[-1].set_xlabel('Month', fontsize=12)
+    fig.suptitle(spec.get('title', 'Monthly CO2 Emissions Time Series by Taxi Type'), fontsize=16)
+
+
+CHART_KINDS = {
+    'seasonal': _plot_seasonal,
+    'monthly': _plot_monthly,
+    'heatmap': _plot_heatmap,
+    'yoy': _plot_yoy,
+    'timeseries': _plot_timeseries,
+}
+
+
+def default_report_specs(frame, kinds=('seasonal', 'monthly', 'heatmap', 'yoy')):
+    """
+    Builds the list of chart specs for a full report. Each spec is a dict with a
+    'kind', a 'filename' and any parameters the chart needs ('year', 'taxi_type', 'title').
+    """
+    specs = []
+    years = _years(frame)
+    if 'seasonal' in kinds:
+        specs.append({'kind': 'seasonal', 'filename': 'co2_seasonal.png'})
+    if 'yoy' in kinds:
+        specs.append({'kind': 'yoy', 'filename': 'co2_yoy.png'})
+    if 'monthly' in kinds:
+        specs.extend({'kind': 'monthly', 'year': int(year), 'filename': f'co2_monthly_{year}.png'} for year in years)
+    if 'heatmap' in kinds:
+        for taxi_type in TAXI_TYPES:
+            specs.append({'kind': 'heatmap', 'taxi_type': taxi_type, 'filename': f'co2_heatmap_{taxi_type}.png'})
+            specs.extend({'kind': 'heatmap', 'taxi_type': taxi_type, 'year': int(year),
+                          'filename': f'co2_heatmap_{taxi_type}_{year}.png'} for year in years)
+    return specs
+
+
+def render_chart(frame, spec, output_dir='.'):
+    """
+    Renders a single chart spec from the frame and saves it. The process-wide
+    figure is cleared and reused rather than creating a new one per chart.
+    """
+    global _FIGURE
+    if _FIGURE is None:
+        # matplotlib is only imported once a chart is actually drawn
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+        _FIGURE = Figure(figsize=(12, 7))
+        FigureCanvasAgg(_FIGURE)  # Non-interactive Agg canvas: we only ever write PNG files
+    fig = _FIGURE
+    fig.clear()
+    CHART_KINDS[spec['kind']](fig, frame, spec)
+
+    path = os.path.join(output_dir, spec['filename'])
+    fig.savefig(path)
+    return path
+
+
+def _init_worker(frame):
+    """Pool initializer: ships the frame to each worker once instead of once per chart."""
+    global _WORKER_FRAME
+    _WORKER_FRAME = frame
+
+
+def _render_in_worker(spec_and_dir):
+    spec, output_dir = spec_and_dir
+    return render_chart(_WORKER_FRAME, spec, output_dir)
+
+
+def render_charts(frame, specs, output_dir='.', processes=None):
+    """
+    Renders a batch of chart specs. With `processes` > 1 the charts are spread
+    across a process pool; otherwise they are rendered in this process.
+
+    Returns:
+        list: The paths of the saved charts, in spec order.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if processes and processes > 1 and len(specs) > 1:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(frame,)) as pool:
+            paths = list(pool.map(_render_in_worker, [(spec, output_dir) for spec in specs]))
+    else:
+        paths = [render_chart(frame, spec, output_dir) for spec in specs]
+    logger.info(f"Rendered {len(paths)} charts into '{output_dir}'.")
+    return paths
+
+
+def build_report(db_file, output_dir="report", processes=None, kinds=('seasonal', 'monthly', 'heatmap', 'yoy')):
+    """
+    Fetches the aggregate once from db_file and renders every chart of a
+    report into output_dir.
+
+    Returns:
+        list: The paths of the saved charts.
+    """
+    import duckdb
+
+    con = duckdb.connect(db_file, read_only=True)
+    try:
+        frame = fetch_aggregate(con)
+    finally:
+        con.close()
+    return render_charts(frame, default_report_specs(frame, kinds), output_dir, processes)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        filename='analysis.log',
+    )
+    DB_FILE = "emissions10yrs.duckdb"
+    REPORT_DIR = "report"
+
+    paths = build_report(DB_FILE, REPORT_DIR, processes=os.cpu_count())
+    print(f"Rendered {len(paths)} charts into '{REPORT_DIR}'.")
@@ -0,0 +1,367 @@
+import argparse
+import duckdb
+import http.client
+import json
+import logging
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import governor
+from timeseries_10yr import MONTHLY_TABLE
+
+# --- Configuration ---
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    filename='service.log',
+    force=True,
+)
+logger = logging.getLogger(__name__)
+DB_FILE = "emissions10yrs.duckdb"
+HOST = "127.0.0.1"
+PORT = 8080
+POOL_SIZE = 4
+CACHE_ENTRIES = 1024
+CACHE_SECONDS = 300
+
+TAXI_TYPES = ['yellow', 'green']
+PERIODS = ['hour_of_day', 'day_of_week', 'week_of_year', 'month_of_year']
+MIN_YEAR, MAX_YEAR = 1900, 9999  # Accepted year parameters; anything else is a 400, not a DuckDB cast error
+
+
+def _pickup_col(taxi_type):
+    return 'tpep_pickup_datetime' if taxi_type == 'yellow' else 'lpep_pickup_datetime'
+
+
+def prepared_statements():
+    """
+    Returns {name: SQL} for every statement the service prepares on each
+    pooled connection. $1 is an optional year (NULL for the whole timespan).
+    """
+    statements = {}
+    for taxi_type in TAXI_TYPES:
+        table_name = f"{taxi_type}_taxi_final"
+        pickup_col = _pickup_col(taxi_type)
+        year_filter = f"($1::INTEGER IS NULL OR year({pickup_col}) = $1)"
+        statements[f"largest_trip_{taxi_type}"] = f"""
+            SELECT {pickup_col} AS pickup_datetime, trip_distance, passenger_count, trip_co2_kgs
+            FROM {table_name}
+            WHERE {year_filter} AND trip_anomaly IS NULL
+            ORDER BY trip_co2_kgs DESC
+            LIMIT 1
+        """
+        for period in PERIODS:
+            # Averages and totals in one scan instead of one query each
+            statements[f"periods_{taxi_type}_{period}"] = f"""
+                SELECT {period} AS period, AVG(trip_co2_kgs) AS avg_co2_kgs, SUM(trip_co2_kgs) AS total_co2_kgs
+                FROM {table_name}
+                WHERE {year_filter}
+                GROUP BY {period}
+            """
+        # $1/$2 bound the series as year * 100 + month
+        statements[f"monthly_series_{taxi_type}"] = f"""
+            SELECT period_start, trips, co2_kgs, co2_yoy_pct, co2_rolling_avg
+            FROM {MONTHLY_TABLE}
+            WHERE taxi_type = '{taxi_type}'
+              AND year * 100 + period BETWEEN COALESCE($1::INTEGER, 0) AND COALESCE($2::INTEGER, 999912)
+            ORDER BY period_start
+        """
+    return statements
+
+
+class ConnectionPool:
+    """
+    A fixed set of cursors over one read-only database instance. Each cursor
+    is its own DuckDB connection with every statement prepared once, and
+    execute() blocks until one is free.
+    """
+
+    def __init__(self, db_file=DB_FILE, size=POOL_SIZE):
+        self.base = duckdb.connect(db_file, read_only=True)
+        governor.configure_connection(self.base, 'analysis')
+        self.available = queue.Queue()
+        self.has_series = self.base.execute(
+            "SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = ?", [MONTHLY_TABLE]
+        ).fetchone()[0] > 0
+        for _ in range(size):
+            cursor = self.base.cursor()
+            for name, sql in prepared_statements().items():
+                if name.startswith('monthly_series') and not self.has_series:
+                    continue
+                cursor.execute(f"PREPARE {name} AS {sql}")
+            self.available.put(cursor)
+        logger.info(f"Opened a pool of {size} read-only connections to '{db_file}'.")
+
+    def execute(self, name, *args):
+        """
+        Runs a prepared statement on a free connection. Arguments must already
+        be validated ints or None: DuckDB's EXECUTE only takes literals.
+        """
+        literals = ", ".join('NULL' if arg is None else str(int(arg)) for arg in args)
+        cursor = self.available.get()
+        try:
+            result = cursor.execute(f"EXECUTE {name}({literals})")
+            columns = [d[0] for d in result.description]
+            return [dict(zip(columns, row)) for row in result.fetchall()]
+        finally:
+            self.available.put(cursor)
+
+    def close(self):
+        while not self.available.empty():
+            self.available.get().close()
+        self.base.close()
+
+
+class ResultCache:
+    """Thread-safe LRU cache of JSON responses with a time-to-live."""
+
+    def __init__(self, entries=CACHE_ENTRIES, seconds=CACHE_SECONDS):
+        self.entries = entries
+        self.seconds = seconds
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            item = self.items.get(key)
+            if item and time.monotonic() - item[0] < self.seconds:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = (time.monotonic(), value)
+            self.items.move_to_end(key)
+            while len(self.items) > self.entries:
+                self.items.popitem(last=False)
+
+
+def _int_param(params, name, kind='year'):
+    """An optional year or YYYYMM ('yearmonth') parameter, range-checked before it reaches DuckDB."""
+    value = params.get(name, [None])[0]
+    if value in (None, ''):
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"'{name}' must be an integer")
+    year, month = divmod(number, 100) if kind == 'yearmonth' else (number, 1)
+    if not (MIN_YEAR <= year <= MAX_YEAR and 1 <= month <= 12):
+        expected = "a YYYYMM month, e.g. 202401," if kind == 'yearmonth' else "a year"
+        raise ValueError(f"'{name}' must be {expected} from {MIN_YEAR} to {MAX_YEAR}")
+    return number
+
+
+def _choice_param(params, name, choices, default=None):
+    value = params.get(name, [default])[0]
+    if value not in choices:
+        raise ValueError(f"'{name}' must be one of {choices}")
+    return value
+
+
+def largest_trip(pool, params):
+    """GET /largest-trip?taxi=yellow[&year=2020]"""
+    taxi_type = _choice_param(params, 'taxi', TAXI_TYPES)
+    rows = pool.execute(f"largest_trip_{taxi_type}", _int_param(params, 'year'))
+    return rows[0] if rows else None
+
+
+def heavy_light_periods(pool, params):
+    """
+    GET /periods?taxi=yellow&period=hour_of_day[&year=2020]
+    The most carbon heavy/light period by average CO2 per trip, and the
+    highest/lowest by total CO2, as in analysis_10yr.
+    """
+    taxi_type = _choice_param(params, 'taxi', TAXI_TYPES)
+    period = _choice_param(params, 'period', PERIODS)
+    rows = pool.execute(f"periods_{taxi_type}_{period}", _int_param(params, 'year'))
+    if not rows:
+        return None
+    by_avg = sorted(rows, key=lambda r: r['avg_co2_kgs'], reverse=True)
+    by_total = sorted(rows, key=lambda r: r['total_co2_kgs'], reverse=True)
+    return {
+        'heaviest_avg': {'period': by_avg[0]['period'], 'avg_co2_kgs': by_avg[0]['avg_co2_kgs']},
+        'lightest_avg': {'period': by_avg[-1]['period'], 'avg_co2_kgs': by_avg[-1]['avg_co2_kgs']},
+        'highest_total': {'period': by_total[0]['period'], 'total_co2_kgs': by_total[0]['total_co2_kgs']},
+        'lowest_total': {'period': by_total[-1]['period'], 'total_co2_kgs': by_total[-1]['total_co2_kgs']},
+    }
+
+
+def monthly_series(pool, params):
+    """GET /monthly-series?taxi=yellow[&start=201901&end=202012] (YYYYMM bounds)"""
+    if not pool.has_series:
+        raise LookupError(f"'{MONTHLY_TABLE}' does not exist; run timeseries_10yr.py first")
+    taxi_type = _choice_param(params, 'taxi', TAXI_TYPES)
+    return pool.execute(f"monthly_series_{taxi_type}", _int_param(params, 'start', 'yearmonth'), _int_param(params, 'end', 'yearmonth'))
+
+
+ENDPOINTS = {
+    '/largest-trip': largest_trip,
+    '/periods': heavy_light_periods,
+    '/monthly-series': monthly_series,
+}
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """Serves ENDPOINTS as JSON. pool and cache are set on the server."""
+    protocol_version = 'HTTP/1.1'  # Keep-alive, so clients reuse their connection
+    disable_nagle_algorithm = True  # Headers and body are separate writes; don't wait on delayed ACKs
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        server = self.server
+        if url.path == '/health':
+            cache = server.cache
+            stats = {'status': 'ok', 'cache_hits': cache.hits if cache else 0, 'cache_misses': cache.misses if cache else 0}
+            return self._send(200, json.dumps(stats).encode())
+
+        endpoint = ENDPOINTS.get(url.path)
+        if endpoint is None:
+            return self._send(404, json.dumps({'error': f"Unknown endpoint '{url.path}'"}).encode())
+
+        # Parameters are normalised into the key so ?a=1&b=2 and ?b=2&a=1 share an entry
+        params = parse_qs(url.query)
+        key = (url.path, tuple(sorted((k, tuple(v)) for k, v in params.items())))
+        body = server.cache.get(key) if server.cache else None
+        if body is None:
+            try:
+                body = json.dumps({'result': endpoint(server.pool, params)}, default=str).encode()
+            except ValueError as e:
+                return self._send(400, json.dumps({'error': str(e)}).encode())
+            except LookupError as e:
+                return self._send(404, json.dumps({'error': str(e)}).encode())
+            except Exception as e:
+                logger.error(f"Query for '{self.path}' failed: {e}")
+                return self._send(500, json.dumps({'error': str(e)}).encode())
+            if server.cache:
+                server.cache.put(key, body)
+        self._send(200, body)
+
+
+def serve(db_file=DB_FILE, host=HOST, port=PORT, pool_size=POOL_SIZE, cache=True):
+    """Runs the query service until interrupted."""
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    server.daemon_threads = True
+    server.pool = ConnectionPool(db_file, pool_size)
+    server.cache = ResultCache() if cache else None
+    print(f"Serving '{db_file}' at http://{host}:{port} ({pool_size} connections, cache {'on' if cache else 'off'})")
+    logger.info(f"Query service listening on {host}:{port}.")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        server.pool.close()
+
+
+def benchmark_paths(years=range(2015, 2025)):
+    """The request mix used by the load generator: every endpoint over every parameter."""
+    paths = []
+    for taxi_type in TAXI_TYPES:
+        paths.append(f"/largest-trip?taxi={taxi_type}")
+        paths.extend(f"/largest-trip?taxi={taxi_type}&year={year}" for year in years)
+        for period in PERIODS:
+            paths.append(f"/periods?taxi={taxi_type}&period={period}")
+            paths.extend(f"/periods?taxi={taxi_type}&period={period}&year={year}" for year in years)
+        paths.append(f"/monthly-series?taxi={taxi_type}")
+        paths.extend(f"/monthly-series?taxi={taxi_type}&start={year}01&end={year}12" for year in years)
+    return paths
+
+
+def benchmark(host=HOST, port=PORT, clients=8, seconds=10, paths=None):
+    """
+    Local load generator: `clients` threads, each on its own keep-alive
+    connection, send random requests from the mix for `seconds`.
+
+    Returns:
+        dict: requests, errors, requests per second and p50/p99 latency in ms.
+    """
+    paths = paths or benchmark_paths()
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client(seed):
+        rng = random.Random(seed)
+        conn = http.client.HTTPConnection(host, port, timeout=30)
+        mine, failed = [], 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                conn.request('GET', rng.choice(paths))
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 500:
+                    failed += 1
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                conn.close()
+                conn = http.client.HTTPConnection(host, port, timeout=30)
+                continue
+            mine.append(time.perf_counter() - start)
+        conn.close()
+        with lock:
+            latencies.extend(mine)
+            errors.append(failed)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    pick = lambda q: latencies[min(int(q * len(latencies)), len(latencies) - 1)] * 1000 if latencies else float('nan')
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'rps': len(latencies) / elapsed,
+        'p50_ms': pick(0.50),
+        'p99_ms': pick(0.99),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local HTTP/JSON query service over the final tables.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve_cmd = sub.add_parser("serve", help="Run the query service.")
+    serve_cmd.add_argument("--db", default=DB_FILE)
+    serve_cmd.add_argument("--port", type=int, default=PORT)
+    serve_cmd.add_argument("--pool-size", type=int, default=POOL_SIZE)
+    serve_cmd.add_argument("--no-cache", action="store_true")
+    bench_cmd = sub.add_parser("bench", help="Load-test a running service.")
+    bench_cmd.add_argument("--port", type=int, default=PORT)
+    bench_cmd.add_argument("--clients", type=int, default=8)
+    bench_cmd.add_argument("--seconds", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        try:
+            serve(args.db, port=args.port, pool_size=args.pool_size, cache=not args.no_cache)
+        except KeyboardInterrupt:
+            print("\nStopped serving.")
+    else:
+        stats = benchmark(port=args.port, clients=args.clients, seconds=args.seconds)
+        print(f"{stats['requests']:,} requests, {stats['errors']} errors: "
+              f"{stats['rps']:,.0f} req/s, p50 {stats['p50_ms']:.2f} ms, p99 {stats['p99_ms']:.2f} ms")
@@ -0,0 +1,195 @@
+import argparse
+import duckdb
+import glob
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import governor
+from anomaly_10yr import build_speed_baselines, reflag_query
+from clean_10yr import QUARANTINE_SAMPLE_TABLE, QUARANTINE_TABLE, clean_green_taxi_data, clean_yellow_taxi_data
+from load_10yr import EMISSIONS_CSV_PATH, YEARS, create_emissions_lookup, load_taxi_data
+from transform_10yr import transform_taxi_data
+from zones_10yr import ZONE_PAIR_TABLE, build_zone_pair_rollup
+
+# --- Configuration ---
+# force=True: the stage modules imported above each configure their own log file
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    filename='shard.log',
+    force=True,
+)
+logger = logging.getLogger(__name__)
+DB_FILE = "emissions10yrs.duckdb"
+SHARD_DIR = "shards"
+
+# Tables each shard contributes. Shards hold disjoint years, so a plain
+# UNION ALL of the shard tables equals what a single-file run produces,
+# except for trip_anomaly in the final tables: each shard flags against
+# baselines from its own years only. merge_shards therefore rebuilds
+# trip_speed_baselines from the merged final tables (which hold every clean
+# trip) and recomputes trip_anomaly against them.
+MERGED_TABLES = ['yellow_taxi_final', 'green_taxi_final', ZONE_PAIR_TABLE, QUARANTINE_TABLE, QUARANTINE_SAMPLE_TABLE]
+FINAL_TABLES = {'yellow_taxi_final': 'yellow', 'green_taxi_final': 'green'}
+
+
+def shard_years(num_shards, years=YEARS):
+    """Splits the years round-robin into `num_shards` disjoint lists."""
+    return [list(years)[i::num_shards] for i in range(num_shards)]
+
+
+def shard_path(shard_id):
+    return os.path.join(SHARD_DIR, f"emissions_shard{shard_id:02d}.duckdb")
+
+
+def run_shard(shard_id, years, processes=1):
+    """
+    Loads, cleans and transforms the given years into this shard's own
+    database file, exactly as load_10yr / clean_10yr / transform_10yr would
+    for the full range. Runs in its own process, so the DuckDB file lock is
+    never shared with another worker.
+
+    Args:
+        shard_id (int): Index of the shard; determines the shard file name.
+        years (list): The years this shard is responsible for.
+        processes (int): Number of shard processes running on this machine.
+
+    Returns:
+        str: Path of the shard database file.
+    """
+    governor.set_process_share(processes)
+    db_file = shard_path(shard_id)
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    # Start from an empty file so rerunning a shard never double-loads its years
+    for path in (db_file, f"{db_file}.wal"):
+        if os.path.exists(path):
+            os.remove(path)
+    print(f"\n>>> Shard {shard_id}: years {years} -> '{db_file}'")
+    logger.info(f"Shard {shard_id}: processing years {years} into '{db_file}'.")
+
+    con = duckdb.connect(db_file)
+    try:
+        governor.configure_connection(con, 'load')
+        for taxi_type in ['yellow', 'green']:
+            load_taxi_data(con, taxi_type, years)
+        create_emissions_lookup(con, EMISSIONS_CSV_PATH)
+    finally:
+        con.close()
+
+    clean_green_taxi_data(db_file)
+    clean_yellow_taxi_data(db_file)
+
+    con = duckdb.connect(db_file)
+    try:
+        con.execute("DROP TABLE IF EXISTS green_taxi_trips;")
+        con.execute("DROP TABLE IF EXISTS yellow_taxi_trips;")
+        governor.configure_connection(con, 'transform')
+        for taxi_type in ['yellow', 'green']:
+            transform_taxi_data(con, taxi_type)
+            build_zone_pair_rollup(con, taxi_type)
+    finally:
+        con.close()
+
+    logger.info(f"Shard {shard_id}: finished '{db_file}'.")
+    return db_file
+
+
+def run_shards(num_shards, years=YEARS):
+    """Runs every shard in its own process and returns the shard file paths."""
+    assignments = shard_years(num_shards, years)
+    with ProcessPoolExecutor(max_workers=num_shards) as pool:
+        futures = [pool.submit(run_shard, shard_id, shard, num_shards) for shard_id, shard in enumerate(assignments)]
+        return [future.result() for future in futures]
+
+
+def _drop_relation(con, name):
+    """Drops a table or view of the given name in the main database, whichever it is."""
+    row = con.execute("""
+        SELECT table_type FROM information_schema.tables
+        WHERE table_catalog = current_database() AND table_schema = 'main' AND table_name = ?
+    """, [name]).fetchone()
+    if row:
+        con.execute(f"DROP {'VIEW' if row[0] == 'VIEW' else 'TABLE'} {name}")
+
+
+def merge_shards(shard_files, db_file=DB_FILE, mode='attach'):
+    """
+    Combines the shard databases for analysis.
+
+    mode='attach': attaches each shard read-only and materializes the union of
+        its tables into db_file, so the existing analysis scripts work as-is.
+    mode='view': exports each shard's tables to Parquet under SHARD_DIR and
+        creates views over them in db_file; nothing is copied into db_file.
+    """
+    print(f"\n--- Merging {len(shard_files)} shards into '{db_file}' ({mode}) ---")
+    con = duckdb.connect(db_file)
+    try:
+        governor.configure_connection(con, 'transform')
+        aliases = []
+        for i, path in enumerate(shard_files):
+            alias = f"shard{i:02d}"
+            con.execute(f"ATTACH '{path}' AS {alias} (READ_ONLY)")
+            aliases.append(alias)
+
+        con.execute(f"CREATE OR REPLACE TABLE vehicle_emissions AS SELECT * FROM {aliases[0]}.vehicle_emissions")
+
+        for table in MERGED_TABLES:
+            if mode == 'view':
+                parquet_dir = os.path.abspath(os.path.join(SHARD_DIR, 'parquet', table))
+                os.makedirs(parquet_dir, exist_ok=True)
+                for alias in aliases:
+                    con.execute(f"COPY {alias}.{table} TO '{parquet_dir}/{alias}.parquet' (FORMAT parquet)")
+                source = f"read_parquet('{parquet_dir}/*.parquet')"
+            else:
+                source = "(" + " UNION ALL BY NAME ".join(f"SELECT * FROM {alias}.{table}" for alias in aliases) + ")"
+
+            query = f"SELECT * FROM {source}"
+            if table in FINAL_TABLES:
+                # Flags must come from baselines over all years, as in a single-file run
+                build_speed_baselines(con, FINAL_TABLES[table], source)
+                query = reflag_query(FINAL_TABLES[table], source)
+            _drop_relation(con, table)
+            if mode == 'view':
+                con.execute(f"CREATE VIEW {table} AS {query}")
+            else:
+                order = " ORDER BY taxi_type, year, month" if table == ZONE_PAIR_TABLE else ""
+                con.execute(f"CREATE TABLE {table} AS {query}{order}")
+
+            count = con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            logger.info(f"Merged '{table}' with {count:,} rows from {len(aliases)} shards.")
+            print(f"Merged '{table}' with {count:,} rows from {len(aliases)} shards.")
+
+        for alias in aliases:
+            con.execute(f"DETACH {alias}")
+    finally:
+        con.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded 10-year pipeline: one DuckDB file per worker.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    all_cmd = sub.add_parser("all", help="Run every shard locally in parallel, then merge.")
+    all_cmd.add_argument("--shards", type=int, default=os.cpu_count() or 1)
+    all_cmd.add_argument("--mode", choices=["attach", "view"], default="attach")
+
+    run_cmd = sub.add_parser("run", help="Run a single shard (e.g. one per node on a shared filesystem).")
+    run_cmd.add_argument("--shard", type=int, required=True)
+    run_cmd.add_argument("--shards", type=int, required=True)
+
+    merge_cmd = sub.add_parser("merge", help="Merge all shard files found in the shard directory.")
+    merge_cmd.add_argument("--mode", choices=["attach", "view"], default="attach")
+
+    args = parser.parse_args()
+    try:
+        if args.command == "all":
+            merge_shards(run_shards(args.shards), mode=args.mode)
+        elif args.command == "run":
+            run_shard(args.shard, shard_years(args.shards)[args.shard])
+        else:
+            merge_shards(sorted(glob.glob(os.path.join(SHARD_DIR, "emissions_shard*.duckdb"))), mode=args.mode)
+        print("\n🎉 Sharded pipeline completed successfully!")
+    except Exception as e:
+        print(f"A fatal error occurred in the main process: {e}")
+        logger.critical(f"A fatal error occurred in the main process: {e}")
@@ -0,0 +1,273 @@
+import argparse
+import duckdb
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+
+import governor
+from anomaly_10yr import BASELINE_TABLE, build_speed_baselines
+from clean_10yr import QUARANTINE_TABLE, clean_query, quarantine_rejects
+from load_10yr import EMISSIONS_CSV_PATH, FINGERPRINT_COLUMN, create_emissions_lookup, fingerprint_expr, trip_columns
+from timeseries_10yr import refresh_daily_rollup
+from transform_10yr import transform_query
+from zones_10yr import build_zone_pair_rollup
+
+# --- Configuration ---
+# force=True: the stage modules imported above each configure their own log file
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    filename='stream.log',
+    force=True,
+)
+logger = logging.getLogger(__name__)
+DB_FILE = "emissions10yrs.duckdb"
+SOURCE_DIR = "incoming"
+POLL_SECONDS = 60
+LEDGER_TABLE = "ingested_files"
+
+# Same naming as the TLC endpoint, e.g. yellow_tripdata_2025-01.parquet
+FILE_PATTERN = re.compile(r"^(yellow|green)_tripdata_(\d{4})-(\d{2})\.parquet$")
+
+
+def ensure_ledger(con):
+    """Creates the table recording which files (and which versions) were ingested."""
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {LEDGER_TABLE} (
+            file_name VARCHAR PRIMARY KEY,
+            taxi_type VARCHAR,
+            year INTEGER,
+            month INTEGER,
+            file_size BIGINT,
+            file_mtime DOUBLE,
+            raw_rows BIGINT,
+            inserted_rows BIGINT,
+            ingested_at TIMESTAMP
+        )
+    """)
+
+
+def pending_files(con, source_dir):
+    """
+    Returns the files in source_dir that are new, or whose size or mtime
+    changed since they were ingested (a re-published month).
+    """
+    seen = {
+        name: (size, mtime)
+        for name, size, mtime in con.execute(f"SELECT file_name, file_size, file_mtime FROM {LEDGER_TABLE}").fetchall()
+    }
+    pending = []
+    for name in sorted(os.listdir(source_dir)):
+        match = FILE_PATTERN.match(name)
+        if not match:
+            continue
+        stat = os.stat(os.path.join(source_dir, name))
+        if seen.get(name) == (stat.st_size, stat.st_mtime):
+            continue
+        taxi_type, year, month = match.group(1), int(match.group(2)), int(match.group(3))
+        pending.append((name, taxi_type, year, month, stat.st_size, stat.st_mtime))
+    return pending
+
+
+def _table_exists(con, table_name):
+    return con.execute(
+        "SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = ? AND database_name = current_database()",
+        [table_name],
+    ).fetchone()[0] > 0
+
+
+def ingest_file(con, source_dir, name, taxi_type, year, month, size, mtime):
+    """
+    Pushes one monthly file through clean and transform as a micro-batch and
+    refreshes the rollups for the months it touched, in one transaction.
+
+    Rows already present in the clean table are excluded, so global
+    deduplication holds across batches and re-published files only add
+    rows that are actually new.
+
+    Returns:
+        int: The number of rows appended to the final table.
+    """
+    path = os.path.join(source_dir, name)
+    cleaned_table = f"{taxi_type}_taxi_trips_clean"
+    final_table = f"{taxi_type}_taxi_final"
+    pickup_col = 'tpep_pickup_datetime' if taxi_type == 'yellow' else 'lpep_pickup_datetime'
+
+    con.execute("BEGIN TRANSACTION")
+    try:
+        # Fingerprint with the clean table's column types so it matches the fingerprints already stored
+        source = f"read_parquet('{path}')"
+        fingerprint = fingerprint_expr(con, cleaned_table if _table_exists(con, cleaned_table) else source, taxi_type)
+        con.execute(f"CREATE OR REPLACE TEMP TABLE stream_raw AS SELECT *, {fingerprint} AS {FINGERPRINT_COLUMN} FROM {source}")
+        raw_rows = con.execute("SELECT COUNT(*) FROM stream_raw").fetchone()[0]
+
+        # Cleaned on its own first, so the file's rejects land in the quarantine tables like a full clean's
+        con.execute(f"CREATE OR REPLACE TEMP TABLE stream_distinct AS {clean_query(taxi_type, 'stream_raw').format(batch_filter='TRUE')}")
+        quarantine_rejects(con, taxi_type, 'stream_raw', 'stream_distinct', source_file=name, source_month=(year, month))
+
+        batch_clean = "SELECT * FROM stream_distinct"
+        if _table_exists(con, cleaned_table):
+            # Anti-join on the fingerprint, only against existing rows in the batch's pickup range.
+            # The column comparisons verify each match, so a hash collision never drops a new trip.
+            verify = "".join(f"\n                   AND c.{c} IS NOT DISTINCT FROM b.{c}" for c in trip_columns(taxi_type))
+            batch_clean = f"""
+                SELECT b.* FROM ({batch_clean}) b
+                ANTI JOIN (
+                    SELECT * FROM {cleaned_table}
+                    WHERE {pickup_col} BETWEEN (SELECT MIN({pickup_col}) FROM stream_raw)
+                                           AND (SELECT MAX({pickup_col}) FROM stream_raw)
+                ) c
+                    ON c.{FINGERPRINT_COLUMN} = b.{FINGERPRINT_COLUMN}{verify}
+            """
+        con.execute(f"CREATE OR REPLACE TEMP TABLE stream_clean AS {batch_clean}")
+
+        batch_final = transform_query(taxi_type, 'stream_clean').format(batch_filter='TRUE')
+        if _table_exists(con, cleaned_table):
+            con.execute(f"INSERT INTO {cleaned_table} BY NAME SELECT * FROM stream_clean")
+        else:
+            con.execute(f"CREATE TABLE {cleaned_table} AS SELECT * FROM stream_clean")
+        # Baselines come from the full transform; only bootstrap them when there are none yet
+        if not _table_exists(con, BASELINE_TABLE) or not con.execute(
+                f"SELECT COUNT(*) FROM {BASELINE_TABLE} WHERE taxi_type = ?", [taxi_type]).fetchone()[0]:
+            build_speed_baselines(con, taxi_type)
+        if _table_exists(con, final_table):
+            con.execute(f"INSERT INTO {final_table} BY NAME {batch_final}")
+        else:
+            con.execute(f"CREATE TABLE {final_table} AS {batch_final}")
+        inserted_rows = con.execute("SELECT COUNT(*) FROM stream_clean").fetchone()[0]
+
+        # Files can contain a few trips outside their nominal month
+        months = con.execute(f"""
+            SELECT DISTINCT year({pickup_col}), month({pickup_col}) FROM stream_clean
+        """).fetchall()
+        if months:
+            build_zone_pair_rollup(con, taxi_type, months)
+            # The daily rollup spans both taxi types, so it needs both final tables
+            if _table_exists(con, 'yellow_taxi_final') and _table_exists(con, 'green_taxi_final'):
+                refresh_daily_rollup(con, taxi_type, months)
+
+        con.execute(f"""
+            INSERT OR REPLACE INTO {LEDGER_TABLE}
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, current_timestamp)
+        """, [name, taxi_type, year, month, size, mtime, raw_rows, inserted_rows])
+        con.execute("DROP TABLE stream_raw")
+        con.execute("DROP TABLE stream_distinct")
+        con.execute("DROP TABLE stream_clean")
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
+    logger.info(f"Ingested '{name}': {raw_rows:,} raw rows, {inserted_rows:,} new rows in '{final_table}'.")
+    print(f"Ingested '{name}': {raw_rows:,} raw rows, {inserted_rows:,} new rows in '{final_table}'.")
+    return inserted_rows
+
+
+def poll_once(con, source_dir):
+    """Ingests every pending file once. Returns the number of files ingested."""
+    ingested = 0
+    for name, taxi_type, year, month, size, mtime in pending_files(con, source_dir):
+        try:
+            ingest_file(con, source_dir, name, taxi_type, year, month, size, mtime)
+            ingested += 1
+        except Exception as e:
+            # Left out of the ledger, so the next poll retries it
+            logger.warning(f"Could not ingest '{name}'. Will retry on the next poll. Error: {e}")
+            print(f"Could not ingest '{name}'. Will retry on the next poll. Error: {e}")
+    return ingested
+
+
+def watch(source_dir=SOURCE_DIR, db_file=DB_FILE, poll_seconds=POLL_SECONDS, once=False):
+    """
+    Polls source_dir for new monthly Parquet files and ingests each as a
+    micro-batch. The write connection is only held for the duration of a poll,
+    so analysis can open the database read-only between polls.
+    """
+    print(f"--- Watching '{source_dir}' for new trip files (every {poll_seconds}s) ---")
+    while True:
+        con = duckdb.connect(db_file)
+        try:
+            governor.configure_connection(con, 'transform')
+            ensure_ledger(con)
+            if not _table_exists(con, 'vehicle_emissions'):
+                create_emissions_lookup(con, EMISSIONS_CSV_PATH)
+            ingested = poll_once(con, source_dir)
+        finally:
+            con.close()
+        if ingested:
+            logger.info(f"Poll complete: {ingested} files ingested.")
+        if once:
+            return
+        time.sleep(poll_seconds)
+
+
+def check_quarantine(path, db_file=DB_FILE):
+    """
+    Streams an already-cleaned month again into a scratch copy of the
+    database and compares its quarantine counts per reason before and after.
+    Returns True when they match, i.e. the month's rejects are not counted
+    twice. The database itself is never modified.
+    """
+    name = os.path.basename(path)
+    match = FILE_PATTERN.match(name)
+    if not match:
+        raise ValueError(f"'{name}' is not named like *_tripdata_YYYY-MM.parquet.")
+    taxi_type, year, month = match.group(1), int(match.group(2)), int(match.group(3))
+    counts = f"""
+        SELECT reason, SUM(rows) FROM {QUARANTINE_TABLE}
+        WHERE taxi_type = ? AND year = ? AND month = ?
+        GROUP BY reason
+    """
+
+    with tempfile.TemporaryDirectory() as scratch:
+        source_dir = os.path.join(scratch, 'incoming')
+        os.makedirs(source_dir)
+        shutil.copy(path, source_dir)
+        scratch_db = os.path.join(scratch, os.path.basename(db_file))
+        shutil.copy(db_file, scratch_db)
+        if os.path.exists(f"{db_file}.wal"):
+            shutil.copy(f"{db_file}.wal", f"{scratch_db}.wal")
+
+        con = duckdb.connect(scratch_db)
+        try:
+            governor.configure_connection(con, 'transform')
+            before = dict(con.execute(counts, [taxi_type, year, month]).fetchall())
+            ensure_ledger(con)
+            con.execute(f"DELETE FROM {LEDGER_TABLE} WHERE file_name = ?", [name])
+            if poll_once(con, source_dir) != 1:
+                raise RuntimeError(f"Could not stream '{name}' into the scratch database.")
+            after = dict(con.execute(counts, [taxi_type, year, month]).fetchall())
+        finally:
+            con.close()
+
+    print(f"\n--- Quarantine of {taxi_type} {year}-{month:02d} before/after streaming '{name}' ---")
+    for reason in sorted(before.keys() | after.keys()):
+        flag = "" if before.get(reason) == after.get(reason) else "  <-- MISMATCH"
+        print(f"{reason}: {before.get(reason, 0):,} -> {after.get(reason, 0):,}{flag}")
+    matched = before == after
+    if not matched:
+        logger.warning(f"Quarantine counts for {taxi_type} {year}-{month:02d} changed after streaming '{name}'.")
+    return matched
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest newly published monthly trip files as micro-batches.")
+    parser.add_argument("--source", default=SOURCE_DIR, help="Directory polled for *_tripdata_YYYY-MM.parquet files.")
+    parser.add_argument("--interval", type=int, default=POLL_SECONDS, help="Seconds between polls.")
+    parser.add_argument("--once", action="store_true", help="Ingest whatever is pending and exit.")
+    parser.add_argument("--check-quarantine", metavar="FILE",
+                        help="Stream an already-cleaned month into a scratch copy and compare its quarantine counts.")
+    args = parser.parse_args()
+
+    try:
+        if args.check_quarantine:
+            raise SystemExit(0 if check_quarantine(args.check_quarantine) else 1)
+        watch(args.source, poll_seconds=args.interval, once=args.once)
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+    except Exception as e:
+        print(f"A fatal error occurred in the main process: {e}")
+        logger.critical(f"A fatal error occurred in the main process: {e}")
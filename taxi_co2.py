@@ -0,0 +1,299 @@
+"""
+taxi-co2: one entry point for the whole 10-year pipeline.
+
+    python taxi_co2.py load|clean|transform|anomalies|analyze|report|timeseries|zones|stream|serve|dbt-report|benchmark|export-columns
+    python taxi_co2.py summary            # row counts and date ranges, no full scans
+    python taxi_co2.py inspect [TABLE]    # cleantest.py-style look at a table
+    python taxi_co2.py startup-check      # measure cold start against the budget
+
+Only the standard library is imported at module level. duckdb, numpy and
+matplotlib are imported inside the command that needs them, so short
+commands start without paying for the heavy imports of the others.
+"""
+import argparse
+import subprocess
+import sys
+import time
+
+DB_FILE = "emissions10yrs.duckdb"
+# Cold start (process spawn to exit) allowed for the short commands
+COLD_START_BUDGET_SECONDS = 0.5
+STARTUP_CHECK_COMMANDS = [['--help'], ['summary'], ['inspect']]
+
+
+def cmd_load(args):
+    import duckdb
+    import governor
+    import load_10yr
+
+    con = duckdb.connect(DB_FILE)
+    try:
+        governor.configure_connection(con, 'load')
+        years = range(args.start_year, args.end_year + 1)
+        for taxi_type in args.taxi:
+            if args.async_fetch:
+                import fetch_10yr
+                fetch_10yr.load_taxi_data_async(con, taxi_type, years)
+            else:
+                load_10yr.load_taxi_data(con, taxi_type, years)
+        load_10yr.create_emissions_lookup(con, load_10yr.EMISSIONS_CSV_PATH)
+        load_10yr.summarize_data(con)
+    finally:
+        con.close()
+
+
+def cmd_clean(args):
+    import clean_10yr
+    clean_10yr.main()
+
+
+def cmd_transform(args):
+    import transform_10yr
+    transform_10yr.main()
+
+
+def cmd_anomalies(args):
+    import duckdb
+    import anomaly_10yr
+
+    con = duckdb.connect(DB_FILE, read_only=True)
+    try:
+        for taxi_type in ['yellow', 'green']:
+            anomaly_10yr.report_anomalies(con, taxi_type)
+    finally:
+        con.close()
+
+
+def cmd_analyze(args):
+    import analysis_10yr
+    analysis_10yr.analyze_data(plot=not args.no_plot)
+
+
+def cmd_report(args):
+    import plots
+    paths = plots.build_report(DB_FILE, args.output_dir, args.processes)
+    print(f"Rendered {len(paths)} charts into '{args.output_dir}'.")
+
+
+def cmd_timeseries(args):
+    import duckdb
+    import governor
+    import timeseries_10yr
+
+    con = duckdb.connect(DB_FILE)
+    try:
+        governor.configure_connection(con, 'transform')
+        timeseries_10yr.build_timeseries(con)
+        timeseries_10yr.report_yearly_trend(con)
+    finally:
+        con.close()
+
+
+def cmd_zones(args):
+    import duckdb
+    import zones_10yr
+
+    con = duckdb.connect(DB_FILE, read_only=True)
+    try:
+        if args.pairs:
+            print(f"\n--- Top {args.n} Origin-Destination Pairs by {args.metric} ---")
+            for pu, do, trips, co2, dist in zones_10yr.top_od_pairs(con, args.n, args.year, args.month, args.taxi, args.metric):
+                print(f"Zone {pu} -> Zone {do}: {co2:,.1f} kgs CO2 over {trips:,} trips ({dist:,.0f} miles)")
+        else:
+            print(f"\n--- Top {args.n} {args.side.capitalize()} Zones by {args.metric} ---")
+            for zone, trips, co2, dist in zones_10yr.top_zones(con, args.n, args.year, args.month, args.taxi, args.side, args.metric):
+                print(f"Zone {zone}: {co2:,.1f} kgs CO2 over {trips:,} trips ({dist:,.0f} miles)")
+    finally:
+        con.close()
+
+
+def cmd_stream(args):
+    import stream_10yr
+    if args.check_quarantine:
+        sys.exit(0 if stream_10yr.check_quarantine(args.check_quarantine, DB_FILE) else 1)
+    stream_10yr.watch(args.source, poll_seconds=args.interval, once=args.once)
+
+
+def cmd_serve(args):
+    import service_10yr
+    try:
+        service_10yr.serve(DB_FILE, port=args.port, pool_size=args.pool_size, cache=not args.no_cache)
+    except KeyboardInterrupt:
+        print("\nStopped serving.")
+
+
+def cmd_dbt_report(args):
+    import dbt_run_report
+    nodes, elapsed = dbt_run_report.parse_run_results(args.path)
+    if args.count_rows:
+        dbt_run_report.count_relation_rows(nodes, DB_FILE)
+    dbt_run_report.print_report(nodes, elapsed)
+
+
+def cmd_benchmark(args):
+    import benchmark_10yr
+    if args.update_baseline:
+        benchmark_10yr.update_baselines(runs=args.runs)
+    else:
+        sys.exit(0 if benchmark_10yr.gate(args.time_tolerance, args.memory_tolerance) else 1)
+
+
+def cmd_export_columns(args):
+    import duckdb
+    import columns_10yr
+
+    con = duckdb.connect(DB_FILE, read_only=True)
+    try:
+        for taxi_type in args.taxi:
+            columns_10yr.export_columns(con, taxi_type, args.columns or columns_10yr.DEFAULT_COLUMNS, args.output_dir)
+    finally:
+        con.close()
+
+
+def cmd_summary(args):
+    """Row counts from DuckDB's catalog plus min/max pickup times (served by zone maps)."""
+    import duckdb
+
+    con = duckdb.connect(DB_FILE, read_only=True)
+    try:
+        tables = con.execute("""
+            SELECT table_name, estimated_size, column_count FROM duckdb_tables()
+            WHERE database_name = current_database()
+            ORDER BY table_name
+        """).fetchall()
+        print(f"--- {DB_FILE} ---")
+        for name, rows, columns in tables:
+            print(f"{name}: ~{rows:,} rows, {columns} columns")
+        for taxi_type in ['yellow', 'green']:
+            table_name = f"{taxi_type}_taxi_final"
+            if table_name not in {t[0] for t in tables}:
+                continue
+            pickup_col = 'tpep_pickup_datetime' if taxi_type == 'yellow' else 'lpep_pickup_datetime'
+            first, last = con.execute(f"SELECT MIN({pickup_col}), MAX({pickup_col}) FROM {table_name}").fetchone()
+            print(f"{table_name} pickups: {first} to {last}")
+    finally:
+        con.close()
+
+
+def cmd_inspect(args):
+    import duckdb
+
+    con = duckdb.connect(DB_FILE, read_only=True)
+    try:
+        print(f"\n--- Contents of '{args.table}' table ---")
+        con.sql(f"SELECT * FROM {args.table} LIMIT {args.limit}").show()
+    finally:
+        con.close()
+
+
+def cmd_startup_check(args):
+    """
+    Spawns the short commands as fresh processes and compares the median
+    wall time of each against COLD_START_BUDGET_SECONDS. Exits 1 if any
+    command is over budget.
+    """
+    over_budget = False
+    print(f"--- Cold-start check (budget {COLD_START_BUDGET_SECONDS:.2f}s, {args.runs} runs each) ---")
+    for command in STARTUP_CHECK_COMMANDS:
+        timings = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, __file__] + command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            timings.append(time.perf_counter() - start)
+        median = sorted(timings)[len(timings) // 2]
+        status = "OK" if median <= COLD_START_BUDGET_SECONDS else "OVER BUDGET"
+        over_budget |= median > COLD_START_BUDGET_SECONDS
+        print(f"taxi-co2 {' '.join(command)}: median {median:.3f}s [{status}]")
+    sys.exit(1 if over_budget else 0)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="taxi-co2", description="NYC taxi CO2 pipeline (2015-2024).")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("load", help="Load raw trip files and the emissions lookup.")
+    p.add_argument("--taxi", nargs="+", choices=["yellow", "green"], default=["yellow", "green"])
+    p.add_argument("--start-year", type=int, default=2015)
+    p.add_argument("--end-year", type=int, default=2024)
+    p.add_argument("--async-fetch", action="store_true",
+                   help="Stream row groups concurrently with HTTP range requests (fetch_10yr.py).")
+    p.set_defaults(func=cmd_load)
+
+    sub.add_parser("clean", help="Clean the raw tables and drop them.").set_defaults(func=cmd_clean)
+    sub.add_parser("transform", help="Build the final tables and zone-pair aggregate.").set_defaults(func=cmd_transform)
+
+    sub.add_parser("anomalies", help="Count flagged trips in the final tables.").set_defaults(func=cmd_anomalies)
+
+    p = sub.add_parser("analyze", help="Print the analysis report (and save the seasonal chart).")
+    p.add_argument("--no-plot", action="store_true", help="Text output only; matplotlib is never imported.")
+    p.set_defaults(func=cmd_analyze)
+
+    p = sub.add_parser("report", help="Render every chart from one aggregate query.")
+    p.add_argument("--output-dir", default="report")
+    p.add_argument("--processes", type=int, default=None)
+    p.set_defaults(func=cmd_report)
+
+    sub.add_parser("timeseries", help="Build the YoY time-series tables.").set_defaults(func=cmd_timeseries)
+
+    p = sub.add_parser("zones", help="Top-N zones or origin-destination pairs.")
+    p.add_argument("-n", type=int, default=20)
+    p.add_argument("--year", type=int)
+    p.add_argument("--month", type=int)
+    p.add_argument("--taxi", choices=["yellow", "green"])
+    p.add_argument("--side", choices=["pickup", "dropoff"], default="pickup")
+    p.add_argument("--metric", choices=["co2_kgs", "trips", "distance_miles"], default="co2_kgs")
+    p.add_argument("--pairs", action="store_true", help="Rank origin-destination pairs instead of zones.")
+    p.set_defaults(func=cmd_zones)
+
+    p = sub.add_parser("stream", help="Ingest new monthly files as micro-batches.")
+    p.add_argument("--source", default="incoming")
+    p.add_argument("--interval", type=int, default=60)
+    p.add_argument("--once", action="store_true")
+    p.add_argument("--check-quarantine", metavar="FILE",
+                   help="Stream an already-cleaned month into a scratch copy and compare its quarantine counts.")
+    p.set_defaults(func=cmd_stream)
+
+    p = sub.add_parser("serve", help="HTTP/JSON query service over the final tables.")
+    p.add_argument("--port", type=int, default=8080)
+    p.add_argument("--pool-size", type=int, default=4)
+    p.add_argument("--no-cache", action="store_true")
+    p.set_defaults(func=cmd_serve)
+
+    p = sub.add_parser("dbt-report", help="Per-model runtime and rows of the last dbt run.")
+    p.add_argument("--path", default="dbt/target/run_results.json")
+    p.add_argument("--count-rows", action="store_true")
+    p.set_defaults(func=cmd_dbt_report)
+
+    p = sub.add_parser("benchmark", help="Time each stage on the synthetic dataset and gate on the baselines.")
+    p.add_argument("--time-tolerance", type=float, default=0.25)
+    p.add_argument("--memory-tolerance", type=float, default=0.25)
+    p.add_argument("--update-baseline", action="store_true", help="Set the baselines from the last --runs runs instead.")
+    p.add_argument("--runs", type=int, default=3)
+    p.set_defaults(func=cmd_benchmark)
+
+    p = sub.add_parser("export-columns", help="Write final-table columns as memory-mappable NumPy files.")
+    p.add_argument("--taxi", nargs="+", choices=["yellow", "green"], default=["yellow", "green"])
+    p.add_argument("--columns", nargs="+", help="Defaults to columns_10yr.DEFAULT_COLUMNS.")
+    p.add_argument("--output-dir", default="columns")
+    p.set_defaults(func=cmd_export_columns)
+
+    sub.add_parser("summary", help="Quick table summary.").set_defaults(func=cmd_summary)
+
+    p = sub.add_parser("inspect", help="Show the first rows of a table.")
+    p.add_argument("table", nargs="?", default="vehicle_emissions")
+    p.add_argument("--limit", type=int, default=20)
+    p.set_defaults(func=cmd_inspect)
+
+    p = sub.add_parser("startup-check", help="Measure cold start of the short commands.")
+    p.add_argument("--runs", type=int, default=5)
+    p.set_defaults(func=cmd_startup_check)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import duckdb
+import logging
+
+import governor
+import plots
+
+# --- Configuration ---
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    filename='analysis.log',
+)
+logger = logging.getLogger(__name__)
+DB_FILE = "emissions10yrs.duckdb"
+
+ROLLUP_TABLE = "co2_daily_rollup"
+MONTHLY_TABLE = "co2_monthly_series"
+WEEKLY_TABLE = "co2_weekly_series"
+
+# Each series is rebuilt from the daily rollup, never from the trip tables.
+# 'period' is the month (1-12) or ISO week (1-53) within 'year'.
+SERIES = {
+    MONTHLY_TABLE: {
+        "trunc": "month",
+        "step": "INTERVAL 1 MONTH",
+        "year": "year(period_start)",
+        "period": "month(period_start)",
+        "rolling_rows": 12,
+    },
+    WEEKLY_TABLE: {
+        "trunc": "week",
+        "step": "INTERVAL 1 WEEK",
+        "year": "isoyear(period_start)",
+        "period": "weekofyear(period_start)",
+        "rolling_rows": 4,
+    },
+}
+
+
+def _rollup_query(taxi_type, where=""):
+    pickup_col = 'tpep_pickup_datetime' if taxi_type == 'yellow' else 'lpep_pickup_datetime'
+    return f"""
+            SELECT
+                '{taxi_type}' AS taxi_type,
+                CAST({pickup_col} AS DATE) AS trip_date,
+                COUNT(*) AS trips,
+                SUM(trip_co2_kgs) AS co2_kgs
+            FROM {taxi_type}_taxi_final
+            {where.format(pickup_col=pickup_col)}
+            GROUP BY ALL
+        """
+
+
+def build_daily_rollup(con):
+    """
+    Scans each final trip table once and stores trips and CO2 per taxi type
+    and pickup date. Every series below is derived from this small table.
+    """
+    print(f"\n--- Building '{ROLLUP_TABLE}' ---")
+    parts = [_rollup_query(taxi_type) for taxi_type in ['yellow', 'green']]
+    con.execute(f"CREATE OR REPLACE TABLE {ROLLUP_TABLE} AS {' UNION ALL '.join(parts)}")
+    count = con.execute(f"SELECT COUNT(*) FROM {ROLLUP_TABLE}").fetchone()[0]
+    logger.info(f"Successfully created '{ROLLUP_TABLE}' with {count:,} rows.")
+    print(f"Successfully created '{ROLLUP_TABLE}' with {count:,} rows.")
+
+
+def build_series(con, table_name):
+    """
+    Builds a dense (year, period) series per taxi type from the daily rollup.
+    Gaps are filled with zero so that window offsets line up, then YoY deltas
+    (same period one year earlier) and a trailing rolling average are added.
+    """
+    cfg = SERIES[table_name]
+    con.execute(f"""
+        CREATE OR REPLACE TABLE {table_name} AS
+        WITH actual AS (
+            SELECT taxi_type, CAST(date_trunc('{cfg['trunc']}', trip_date) AS DATE) AS period_start,
+                   CAST(SUM(trips) AS BIGINT) AS trips, SUM(co2_kgs) AS co2_kgs
+            FROM {ROLLUP_TABLE}
+            GROUP BY ALL
+        ),
+        calendar AS (
+            SELECT taxi_type, CAST(unnest(generate_series(MIN(period_start), MAX(period_start), {cfg['step']})) AS DATE) AS period_start
+            FROM actual
+            GROUP BY taxi_type
+        ),
+        dense AS (
+            SELECT
+                c.taxi_type,
+                {cfg['year']} AS year,
+                {cfg['period']} AS period,
+                c.period_start,
+                COALESCE(a.trips, 0) AS trips,
+                COALESCE(a.co2_kgs, 0) AS co2_kgs
+            FROM calendar c
+            LEFT JOIN actual a USING (taxi_type, period_start)
+        )
+        SELECT
+            d.*,
+            d.co2_kgs - p.co2_kgs AS co2_yoy_delta,
+            (d.co2_kgs - p.co2_kgs) / NULLIF(p.co2_kgs, 0) * 100 AS co2_yoy_pct,
+            d.trips - p.trips AS trips_yoy_delta,
+            AVG(d.co2_kgs) OVER rolling AS co2_rolling_avg,
+            AVG(d.trips) OVER rolling AS trips_rolling_avg
+        FROM dense d
+        LEFT JOIN dense p
+            ON p.taxi_type = d.taxi_type AND p.year = d.year - 1 AND p.period = d.period
+        WINDOW rolling AS (
+            PARTITION BY d.taxi_type ORDER BY d.period_start
+            ROWS BETWEEN {cfg['rolling_rows'] - 1} PRECEDING AND CURRENT ROW
+        )
+        ORDER BY d.taxi_type, d.period_start
+    """)
+    count = con.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+    logger.info(f"Successfully created '{table_name}' with {count:,} rows.")
+    print(f"Successfully created '{table_name}' with {count:,} rows.")
+
+
+def decompose_monthly_series(con):
+    """
+    Adds a classical additive seasonal decomposition to the monthly series:
+      - trend: centered 2x12 moving average (NULL for the first/last 6 months)
+      - seasonal: mean detrended value per calendar month, centered on zero
+      - residual: co2_kgs - trend - seasonal
+    """
+    con.execute(f"""
+        CREATE OR REPLACE TABLE {MONTHLY_TABLE} AS
+        WITH trended AS (
+            SELECT
+                *,
+                CASE WHEN LAG(co2_kgs, 6) OVER w IS NOT NULL AND LEAD(co2_kgs, 6) OVER w IS NOT NULL THEN
+                    (SUM(co2_kgs) OVER (w ROWS BETWEEN 6 PRECEDING AND 6 FOLLOWING)
+                     - 0.5 * LAG(co2_kgs, 6) OVER w
+                     - 0.5 * LEAD(co2_kgs, 6) OVER w) / 12.0
+                END AS trend
+            FROM {MONTHLY_TABLE}
+            WINDOW w AS (PARTITION BY taxi_type ORDER BY period_start)
+        ),
+        raw_seasonal AS (
+            SELECT *, AVG(co2_kgs - trend) OVER (PARTITION BY taxi_type, period) AS seasonal_raw
+            FROM trended
+        ),
+        seasonal AS (
+            SELECT
+                * EXCLUDE (seasonal_raw),
+                seasonal_raw - AVG(seasonal_raw) OVER (PARTITION BY taxi_type) AS seasonal
+            FROM raw_seasonal
+        )
+        SELECT *, co2_kgs - trend - seasonal AS residual
+        FROM seasonal
+        ORDER BY taxi_type, period_start
+    """)
+    logger.info(f"Added seasonal decomposition to '{MONTHLY_TABLE}'.")
+
+
+def refresh_daily_rollup(con, taxi_type, months):
+    """
+    Recomputes the daily rollup rows of one taxi type for the given
+    (year, month) pairs only, then rebuilds the (small) derived series.
+    Builds everything from scratch if the rollup does not exist yet.
+    """
+    exists = con.execute(
+        "SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = ? AND database_name = current_database()",
+        [ROLLUP_TABLE],
+    ).fetchone()[0]
+    if not exists:
+        build_timeseries(con)
+        return
+
+    month_keys = ", ".join(str(year * 100 + month) for year, month in months)
+    con.execute(f"""
+        DELETE FROM {ROLLUP_TABLE}
+        WHERE taxi_type = ? AND year(trip_date) * 100 + month(trip_date) IN ({month_keys})
+    """, [taxi_type])
+    where = f"WHERE year({{pickup_col}}) * 100 + month({{pickup_col}}) IN ({month_keys})"
+    con.execute(f"INSERT INTO {ROLLUP_TABLE} {_rollup_query(taxi_type, where)}")
+    for table_name in SERIES:
+        build_series(con, table_name)
+    decompose_monthly_series(con)
+
+
+def build_timeseries(con):
+    """Builds the daily rollup and all derived series tables."""
+    build_daily_rollup(con)
+    for table_name in SERIES:
+        build_series(con, table_name)
+    decompose_monthly_series(con)
+
+
+def report_yearly_trend(con):
+    """Prints yearly totals and YoY change per taxi type from the monthly series."""
+    rows = con.execute(f"""
+        SELECT
+            taxi_type,
+            year,
+            CAST(SUM(trips) AS BIGINT) AS trips,
+            SUM(co2_kgs) AS co2_kgs,
+            (SUM(co2_kgs) - LAG(SUM(co2_kgs)) OVER (PARTITION BY taxi_type ORDER BY year))
+                / NULLIF(LAG(SUM(co2_kgs)) OVER (PARTITION BY taxi_type ORDER BY year), 0) * 100 AS co2_yoy_pct
+        FROM {MONTHLY_TABLE}
+        GROUP BY taxi_type, year
+        ORDER BY taxi_type DESC, year
+    """).fetchall()
+
+    print("\n--- Year-over-Year CO2 Totals ---")
+    for taxi_type, year, trips, co2_kgs, pct in rows:
+        change = f"{pct:+.1f}%" if pct is not None else "n/a"
+        line = f"{taxi_type.upper()} {year}: {trips:,} trips, {co2_kgs:,.0f} kgs CO2 (YoY {change})"
+        print(line)
+        logger.info(line)
+
+
+def fetch_monthly_series(con):
+    """Returns the monthly series table as a columnar frame for plotting."""
+    return con.execute(f"""
+        SELECT taxi_type, year, period AS month, period_start, trips, co2_kgs,
+               co2_rolling_avg, trend, seasonal, residual
+        FROM {MONTHLY_TABLE}
+        ORDER BY taxi_type, period_start
+    """).fetchnumpy()
+
+
+if __name__ == "__main__":
+    con = None
+    try:
+        con = duckdb.connect(DB_FILE)
+        governor.configure_connection(con, 'transform')
+        build_timeseries(con)
+        report_yearly_trend(con)
+
+        plot_filename = 'monthly_co2_timeseries_10yrs.png'
+        plots.render_chart(fetch_monthly_series(con), {'kind': 'timeseries', 'filename': plot_filename})
+        print(f"Plot saved successfully as '{plot_filename}'.")
+        logger.info(f"Plot saved as '{plot_filename}'.")
+
+    except Exception as e:
+        print(f"A fatal error occurred in the main process: {e}")
+        logger.error(f"A fatal error occurred in the main process: {e}")
+    finally:
+        if con:
+            con.close()
@@ -1,6 +1,10 @@
 import duckdb
 import logging
 
+import governor
+from anomaly_10yr import anomaly_expr, baseline_joins, build_speed_baselines
+from zones_10yr import build_zone_pair_rollup
+
 # --- Configuration ---
 logging.basicConfig(
     level=logging.INFO,
@@ -10,31 +14,17 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 DB_FILE = "emissions10yrs.duckdb"
 
-def transform_taxi_data(con, taxi_type):
-    """
-    Transforms cleaned taxi data by adding analytical columns.
-    Creates a new, final table for analysis.
 
-    Args:
-        con: An active DuckDB connection.
-        taxi_type (str): The type of taxi data to transform ('yellow' or 'green').
+def transform_query(taxi_type, cleaned_table):
+    """
+    Returns the SELECT that adds the analytical columns to a cleaned table.
+    Contains a '{batch_filter}' placeholder (see governor.create_table_as).
+    Needs the speed baselines of the taxi type (see anomaly_10yr.build_speed_baselines).
     """
-    print(f"\n--- Transforming {taxi_type.capitalize()} Taxi Data ---")
-
-    # Define table names and date columns dynamically
-    cleaned_table = f"{taxi_type}_taxi_trips_clean"
-    final_table = f"{taxi_type}_taxi_final"
     date_column_prefix = 'tpep' if taxi_type == 'yellow' else 'lpep'
     pickup_col = f"{date_column_prefix}_pickup_datetime"
     dropoff_col = f"{date_column_prefix}_dropoff_datetime"
-    
-    try:
-        logger.info(f"Transforming data from '{cleaned_table}' into '{final_table}'.")
-
-        # This query creates a new table with all transformations applied.
-        # It reads from the _clean table and writes to the _final table.
-        transform_query = f"""
-            CREATE OR REPLACE TABLE {final_table} AS
+    return f"""
             SELECT
                 t.*, -- Select all columns from the clean table
 
@@ -54,15 +44,45 @@ def transform_taxi_data(con, taxi_type):
                 weekofyear({pickup_col}) AS week_of_year,
 
                 -- 6. Extract MONTH
-                month({pickup_col}) AS month_of_year
+                month({pickup_col}) AS month_of_year,
+
+                -- 7. Flag implausible trips against the zone/hour speed and distance baselines (NULL = plausible)
+                {anomaly_expr(pickup_col, dropoff_col)} AS trip_anomaly
 
             FROM 
                 {cleaned_table} t
             JOIN 
-                vehicle_emissions e ON e.vehicle_type = '{taxi_type}_taxi'
+                vehicle_emissions e ON e.vehicle_type = '{taxi_type}_taxi'{baseline_joins(taxi_type, pickup_col)}
+            WHERE
+                {{batch_filter}}
         """
-        
-        con.execute(transform_query)
+
+def transform_taxi_data(con, taxi_type):
+    """
+    Transforms cleaned taxi data by adding analytical columns.
+    Creates a new, final table for analysis.
+
+    Args:
+        con: An active DuckDB connection.
+        taxi_type (str): The type of taxi data to transform ('yellow' or 'green').
+    """
+    print(f"\n--- Transforming {taxi_type.capitalize()} Taxi Data ---")
+
+    # Define table names and date columns dynamically
+    cleaned_table = f"{taxi_type}_taxi_trips_clean"
+    final_table = f"{taxi_type}_taxi_final"
+    date_column_prefix = 'tpep' if taxi_type == 'yellow' else 'lpep'
+    pickup_col = f"{date_column_prefix}_pickup_datetime"
+    
+    try:
+        # One grouped pass over the clean table for the baselines the anomaly flags compare against
+        build_speed_baselines(con, taxi_type)
+
+        logger.info(f"Transforming data from '{cleaned_table}' into '{final_table}'.")
+
+        # Reads from the _clean table and writes to the _final table, in month
+        # batches if the governor decides it would not fit in memory.
+        governor.create_table_as(con, final_table, transform_query(taxi_type, cleaned_table), cleaned_table, pickup_col)
         
         # Verification
         final_count = con.execute(f"SELECT COUNT(*) FROM {final_table}").fetchone()[0]
@@ -73,16 +93,22 @@ def transform_taxi_data(con, taxi_type):
         logger.error(f"An error occurred during transformation for {taxi_type} data: {e}")
         print(f"An error occurred during transformation for {taxi_type} data: {e}")
 
-if __name__ == "__main__":
+def main():
+    """Transforms both taxi types and builds the zone-pair aggregate."""
     con = None
     try:
         # Connect to the database once
         con = duckdb.connect(DB_FILE)
+        governor.configure_connection(con, 'transform')
         
         # Call the reusable function for each taxi type
         transform_taxi_data(con, 'yellow')
         transform_taxi_data(con, 'green')
 
+        # Build the zone-pair aggregate used for spatial queries
+        build_zone_pair_rollup(con, 'yellow')
+        build_zone_pair_rollup(con, 'green')
+
         # con.execute("DROP TABLE yellow_taxi_trips_clean;")
         # print("Dropped table 'yellow_taxi_trips_clean'.")
         # logger.info("Dropped table 'yellow_taxi_trips_clean'.")
@@ -93,4 +119,8 @@ if __name__ == "__main__":
         
     except Exception as e:
         print(f"A fatal error occurred in the main process: {e}")
-        logger.error(f"A fatal error occurred in the main process: {e}")
\ No newline at end of file
+        logger.error(f"A fatal error occurred in the main process: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import duckdb
+import logging
+
+# --- Configuration ---
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    filename='analysis.log',
+)
+logger = logging.getLogger(__name__)
+DB_FILE = "emissions10yrs.duckdb"
+
+ZONE_PAIR_TABLE = "zone_pair_monthly"
+METRICS = ('co2_kgs', 'trips', 'distance_miles')
+SIDES = {'pickup': 'PULocationID', 'dropoff': 'DOLocationID'}
+
+
+def build_zone_pair_rollup(con, taxi_type, months=None):
+    """
+    Rebuilds the zone-pair aggregate for one taxi type from its final table.
+    One row per (year, month, PULocationID, DOLocationID) with trip counts,
+    CO2 and distance sums. Rows are inserted sorted by (year, month) so each
+    month lands in its own run of row groups and DuckDB's min/max zone maps
+    skip every other month when a query filters on time.
+
+    Args:
+        con: An active DuckDB connection.
+        taxi_type (str): The type of taxi data to aggregate ('yellow' or 'green').
+        months (list): Optional (year, month) pairs; only these months are
+            recomputed, e.g. after a micro-batch lands. Defaults to all months.
+    """
+    final_table = f"{taxi_type}_taxi_final"
+    pickup_col = 'tpep_pickup_datetime' if taxi_type == 'yellow' else 'lpep_pickup_datetime'
+    month_keys = ", ".join(str(year * 100 + month) for year, month in months) if months else None
+    delete_filter = f"AND year * 100 + month IN ({month_keys})" if month_keys else ""
+    source_filter = f"WHERE year({pickup_col}) * 100 + month_of_year IN ({month_keys})" if month_keys else ""
+
+    try:
+        logger.info(f"Aggregating '{final_table}' into '{ZONE_PAIR_TABLE}'.")
+        con.execute(f"""
+            CREATE TABLE IF NOT EXISTS {ZONE_PAIR_TABLE} (
+                taxi_type VARCHAR,
+                year INTEGER,
+                month INTEGER,
+                PULocationID INTEGER,
+                DOLocationID INTEGER,
+                trips BIGINT,
+                co2_kgs DOUBLE,
+                distance_miles DOUBLE
+            )
+        """)
+        con.execute(f"DELETE FROM {ZONE_PAIR_TABLE} WHERE taxi_type = ? {delete_filter}", [taxi_type])
+        con.execute(f"""
+            INSERT INTO {ZONE_PAIR_TABLE}
+            SELECT
+                '{taxi_type}' AS taxi_type,
+                year({pickup_col}) AS year,
+                month_of_year AS month,
+                PULocationID,
+                DOLocationID,
+                COUNT(*) AS trips,
+                SUM(trip_co2_kgs) AS co2_kgs,
+                SUM(trip_distance) AS distance_miles
+            FROM {final_table}
+            {source_filter}
+            GROUP BY ALL
+            ORDER BY year, month, PULocationID, DOLocationID
+        """)
+        count = con.execute(f"SELECT COUNT(*) FROM {ZONE_PAIR_TABLE} WHERE taxi_type = ?", [taxi_type]).fetchone()[0]
+        logger.info(f"Stored {count:,} {taxi_type} zone-pair rows in '{ZONE_PAIR_TABLE}'.")
+        print(f"Stored {count:,} {taxi_type} zone-pair rows in '{ZONE_PAIR_TABLE}'.")
+
+    except Exception as e:
+        logger.error(f"An error occurred while aggregating zones for {taxi_type} data: {e}")
+        print(f"An error occurred while aggregating zones for {taxi_type} data: {e}")
+
+
+def _filters(year=None, month=None, taxi_type=None):
+    """Builds a WHERE clause and its parameters from the optional filters."""
+    clauses, params = [], []
+    for column, value in (('year', year), ('month', month), ('taxi_type', taxi_type)):
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return where, params
+
+
+def top_zones(con, n=20, year=None, month=None, taxi_type=None, side='pickup', metric='co2_kgs'):
+    """
+    Returns the top-N pickup (or dropoff) zones ranked by a metric.
+
+    Returns:
+        list: (location_id, trips, co2_kgs, distance_miles) tuples, highest first.
+    """
+    if side not in SIDES or metric not in METRICS:
+        raise ValueError(f"side must be one of {list(SIDES)} and metric one of {list(METRICS)}")
+    where, params = _filters(year, month, taxi_type)
+    return con.execute(f"""
+        SELECT {SIDES[side]} AS location_id,
+               CAST(SUM(trips) AS BIGINT) AS trips,
+               SUM(co2_kgs) AS co2_kgs,
+               SUM(distance_miles) AS distance_miles
+        FROM {ZONE_PAIR_TABLE}
+        {where}
+        GROUP BY location_id
+        ORDER BY {metric} DESC
+        LIMIT ?
+    """, params + [n]).fetchall()
+
+
+def top_od_pairs(con, n=20, year=None, month=None, taxi_type=None, metric='co2_kgs'):
+    """
+    Returns the top-N origin-destination zone pairs ranked by a metric.
+
+    Returns:
+        list: (PULocationID, DOLocationID, trips, co2_kgs, distance_miles) tuples, highest first.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"metric must be one of {list(METRICS)}")
+    where, params = _filters(year, month, taxi_type)
+    return con.execute(f"""
+        SELECT PULocationID,
+               DOLocationID,
+               CAST(SUM(trips) AS BIGINT) AS trips,
+               SUM(co2_kgs) AS co2_kgs,
+               SUM(distance_miles) AS distance_miles
+        FROM {ZONE_PAIR_TABLE}
+        {where}
+        GROUP BY PULocationID, DOLocationID
+        ORDER BY {metric} DESC
+        LIMIT ?
+    """, params + [n]).fetchall()
+
+
+if __name__ == "__main__":
+    con = None
+    try:
+        con = duckdb.connect(DB_FILE, read_only=True)
+        latest_year = con.execute(f"SELECT MAX(year) FROM {ZONE_PAIR_TABLE}").fetchone()[0]
+
+        print(f"\n--- Top 20 Origin-Destination Pairs by CO2 ({latest_year}) ---")
+        for pu, do, trips, co2, dist in top_od_pairs(con, n=20, year=latest_year):
+            print(f"Zone {pu} -> Zone {do}: {co2:,.1f} kgs CO2 over {trips:,} trips ({dist:,.0f} miles)")
+
+        print(f"\n--- Top 20 Pickup Zones by CO2 ({latest_year}) ---")
+        for zone, trips, co2, dist in top_zones(con, n=20, year=latest_year):
+            print(f"Zone {zone}: {co2:,.1f} kgs CO2 over {trips:,} trips ({dist:,.0f} miles)")
+
+    except Exception as e:
+        print(f"A fatal error occurred in the main process: {e}")
+        logger.error(f"A fatal error occurred in the main process: {e}")
+    finally:
+        if con:
+            con.close()